@@ -2,7 +2,7 @@ import json
 
 import matplotlib.pyplot as plt
 
-import random
+import numpy as np
 
 import functools
 
@@ -61,12 +61,27 @@ print(f'{len(searches_for_plus_strand_reads)=}')
 print()
 
 
-length_multiplied = []
-for search in searches_for_plus_strand_reads:
-    read_length = search['query_len']
-    for i in range(read_length):
-        length_multiplied.append(search)
-print(f'{len(length_multiplied)=}')
+class LengthWeightedSample:
+    @staticmethod
+    def of(searches, sample_size, seed=0):
+        """Returns a sample of the searches drawn in proportion to read length.
+
+        Equivalent to listing each search once per read position,
+        shuffling the list and taking the first sample-size entries
+        (i.e., read positions are drawn without replacement),
+        but only ever holds the cumulative read lengths in memory.
+        """
+        read_lengths = np.array([search['query_len'] for search in searches], dtype=np.int64)
+        cumulative_read_lengths = np.cumsum(read_lengths)
+        total_read_length = int(cumulative_read_lengths[-1])
+        assert sample_size <= total_read_length
+        rng = np.random.default_rng(seed)
+        read_positions = rng.choice(total_read_length, size=sample_size, replace=False)
+        indices = np.searchsorted(cumulative_read_lengths, read_positions, side='right')
+        return [searches[i] for i in indices]
+
+
+print(f'{sum([search["query_len"] for search in searches_for_plus_strand_reads])=}')
 print()
 
 
@@ -167,9 +182,7 @@ print()
 """
 fig, ax = plt.subplots()
 
-random.shuffle(length_multiplied)
-
-subset = length_multiplied[:int(1.5e4)]
+subset = LengthWeightedSample.of(searches_for_plus_strand_reads, int(1.5e4), seed=0)
 subset.sort(key=functools.cmp_to_key(cmp_num_aligned_positions), reverse=True)
 
 y = 0
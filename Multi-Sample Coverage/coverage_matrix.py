@@ -0,0 +1,241 @@
+import json
+
+import concurrent.futures
+
+import numpy as np
+
+
+# the strand classes that depth is computed for
+# (type I and type II minus-strand reads are subsets of minus-strand reads)
+strand_classes = ['plus', 'minus', 'plus_minus_hybrid', 'type_i_minus', 'type_ii_minus']
+
+
+class Searches:
+    @staticmethod
+    def in_(blast_output):
+        """Returns all searches in the BLAST output."""
+        return [item['report']['results']['search'] for item in blast_output['BlastOutput2']]
+
+
+class ReadLength:
+    @staticmethod
+    def for_(search):
+        """Returns the length of the read for the search."""
+        read_length = search['query_len']
+        assert type(read_length) == int
+        assert read_length > 0
+        return read_length
+
+
+class VirusHit:
+    @staticmethod
+    def for_(search, virus):
+        """Returns the single hit to the virus for the search.
+
+        Returns None if the search does not have exactly one hit to the virus.
+        """
+        hits = [hit for hit in search['hits'] if hit['description'][0]['title'].upper() == virus]
+        return hits[0] if len(hits) == 1 else None
+
+
+class Hsps:
+    @staticmethod
+    def for_(hit):
+        """Returns the hsps for the hit."""
+        hsps = hit['hsps']
+        assert type(hsps) == list
+        assert len(hsps) > 0
+        return hsps
+
+
+def has_plus_hit_strand(hsp):
+    return hsp['hit_strand'] == 'Plus'
+
+
+def has_minus_hit_strand(hsp):
+    return hsp['hit_strand'] == 'Minus'
+
+
+class StrandClasses:
+    @staticmethod
+    def for_(search, hit):
+        """Returns the strand classes that the read for the search belongs to."""
+        hsps = Hsps.for_(hit)
+        if all(map(has_plus_hit_strand, hsps)):
+            return ['plus']
+        elif all(map(has_minus_hit_strand, hsps)):
+            min_query_from = min(hsp['query_from'] for hsp in hsps)
+            query_fraction = min_query_from / ReadLength.for_(search)
+            if query_fraction <= 0.05:
+                return ['minus', 'type_i_minus']
+            elif 0.4 <= query_fraction <= 0.53:
+                return ['minus', 'type_ii_minus']
+            else:
+                return ['minus']
+        else:
+            return ['plus_minus_hybrid']
+
+
+class CoveredIntervals:
+    @staticmethod
+    def for_(hit):
+        """Returns the hit intervals covered by the hsps of the hit.
+
+        Intervals are inclusive and merged so that each hit position is covered
+        at most once per read (the same as taking the set of unique covered positions).
+        """
+        intervals = sorted([
+            (min(hsp['hit_from'], hsp['hit_to']), max(hsp['hit_from'], hsp['hit_to']))
+            for hsp in Hsps.for_(hit)
+        ])
+        merged = [list(intervals[0])]
+        for start, end in intervals[1:]:
+            if start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+
+class Depth:
+    @staticmethod
+    def of(starts, ends, genome_length):
+        """Returns the depth at each genome position for the given inclusive intervals.
+
+        Index 0 of the returned array is genome position 1.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        assert np.all(1 <= starts) and np.all(starts <= ends) and np.all(ends <= genome_length)
+        changes = np.bincount(starts - 1, minlength=genome_length + 1)
+        changes -= np.bincount(ends, minlength=genome_length + 1)
+        return np.cumsum(changes[:genome_length])
+
+
+def sample_coverage(blast_output_file_path, virus, genome_length):
+    """Computes the depth per strand class for a single sample.
+
+    Returns a dictionary of depth arrays (keyed by strand class)
+    and a dictionary of read counts (also keyed by strand class).
+    """
+    with open(blast_output_file_path, 'r') as f:
+        blast_output = json.loads(f.read())
+
+    all_searches = Searches.in_(blast_output)
+
+    starts = {strand_class: [] for strand_class in strand_classes}
+    ends = {strand_class: [] for strand_class in strand_classes}
+    read_counts = {strand_class: 0 for strand_class in strand_classes}
+
+    read_counts['all'] = len(all_searches)
+    read_counts['viral'] = 0
+
+    for search in all_searches:
+        hit = VirusHit.for_(search, virus)
+        if hit is None:
+            continue
+        read_counts['viral'] += 1
+        intervals = CoveredIntervals.for_(hit)
+        for strand_class in StrandClasses.for_(search, hit):
+            read_counts[strand_class] += 1
+            starts[strand_class].extend(start for start, end in intervals)
+            ends[strand_class].extend(end for start, end in intervals)
+
+    depths = {
+        strand_class: Depth.of(starts[strand_class], ends[strand_class], genome_length)
+        for strand_class in strand_classes
+    }
+
+    return depths, read_counts
+
+
+class CoverageMatrix:
+    @staticmethod
+    def for_(samples, virus, genome_length, max_workers=None):
+        """Computes a (samples x genome positions) depth matrix per strand class.
+
+        Samples are given as (sample name, BLAST output file path) pairs
+        and are processed in a process pool.
+        """
+        sample_names = [name for name, path in samples]
+        blast_output_file_paths = [path for name, path in samples]
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                sample_coverage,
+                blast_output_file_paths,
+                [virus] * len(samples),
+                [genome_length] * len(samples),
+            ))
+
+        matrices = {
+            strand_class: np.stack([depths[strand_class] for depths, read_counts in results])
+            for strand_class in strand_classes
+        }
+
+        read_count_keys = ['all', 'viral', *strand_classes]
+        read_counts = np.array(
+            [[counts[key] for key in read_count_keys] for depths, counts in results],
+            dtype=np.int64,
+        )
+
+        return {
+            'sample_names': np.array(sample_names),
+            'blast_output_file_paths': np.array(blast_output_file_paths),
+            'virus': np.array(virus),
+            'genome_length': np.array(genome_length),
+            'read_count_keys': np.array(read_count_keys),
+            'read_counts': read_counts,
+            **matrices,
+        }
+
+
+if __name__ == '__main__':
+    print()
+
+
+    virus = 'CY1'
+    genome_length = 2692
+
+    samples = [
+        ('ivt_cy1_gRNA', 'blast_output_ivt_cy1_gRNA.json'),
+        ('cy1_nb_2wpi_leaf', 'blast_output_cy1_nb_2wpi_leaf.json'),
+        ('cy1_nb_2wpi_root', 'blast_output_cy1_nb_2wpi_root.json'),
+        ('cy1_nb_6wpi_leaf', 'blast_output_cy1_nb_6wpi_leaf.json'),
+        ('cy1_nb_6wpi_root', 'blast_output_cy1_nb_6wpi_root.json'),
+    ]
+
+    #virus = 'CY2'
+    #genome_length = 2983
+
+    #samples = [
+    #    ('cy2_nb_14wpi_leaf', 'blast_output_cy2_nb_14wpi_leaf.json'),
+    #    ('cy2_hemp_leaf', 'blast_output_cy2_hemp_leaf.json'),
+    #]
+
+    print(f'{virus=}')
+    print(f'{genome_length=}')
+    print(f'{len(samples)=}')
+    print()
+
+
+    coverage_matrix = CoverageMatrix.for_(samples, virus, genome_length)
+    print('Successfully computed coverage matrix!')
+    print()
+
+
+    for i, sample_name in enumerate(coverage_matrix['sample_names']):
+        print(f'{sample_name}: ' + ', '.join([
+            f'{key}={count}'
+            for key, count in zip(coverage_matrix['read_count_keys'], coverage_matrix['read_counts'][i])
+        ]))
+    print()
+
+
+    coverage_matrix_file_path = f'coverage_matrix_{virus.lower()}.npz'
+    print(f'{coverage_matrix_file_path=}')
+    print()
+
+    np.savez_compressed(coverage_matrix_file_path, **coverage_matrix)
+    print('Saved coverage matrix.')
+    print()
@@ -0,0 +1,116 @@
+import numpy as np
+
+from coverage_matrix import strand_classes
+
+
+class Runs:
+    @staticmethod
+    def of(values):
+        """Returns the runs of equal adjacent values as (starts, ends, run values).
+
+        Starts and ends are 0-based and half-open (i.e., as in bedGraph files).
+        NaN values are considered equal to each other.
+        """
+        values = np.asarray(values)
+        assert values.ndim == 1
+        assert len(values) > 0
+        is_nan = np.isnan(values) if values.dtype.kind == 'f' else np.zeros(len(values), dtype=bool)
+        is_change = (values[1:] != values[:-1]) & ~(is_nan[1:] & is_nan[:-1])
+        starts = np.concatenate([[0], np.flatnonzero(is_change) + 1])
+        ends = np.concatenate([starts[1:], [len(values)]])
+        return starts, ends, values[starts]
+
+
+def format_value(value):
+    if isinstance(value, (np.integer, int)):
+        return str(value)
+    elif np.isnan(value):
+        # as genome browsers expect it
+        return 'NaN'
+    else:
+        return f'{value:.6g}'
+
+
+def write_bedgraph(file_path, values, chrom, track_name=None, skip_zeros=True):
+    """Writes the values (index 0 is genome position 1) to a bedGraph file.
+
+    Adjacent positions with equal values are collapsed into single lines.
+    Positions with NaN values (and zero values if skip-zeros is True) are left out.
+    """
+    starts, ends, run_values = Runs.of(values)
+    lines = []
+    if track_name is not None:
+        lines.append(f'track type=bedGraph name="{track_name}"')
+    for start, end, value in zip(starts.tolist(), ends.tolist(), run_values):
+        if np.isnan(value) or (skip_zeros and value == 0):
+            continue
+        lines.append(f'{chrom}\t{start}\t{end}\t{format_value(value)}')
+    with open(file_path, 'w', buffering=1 << 20) as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_wiggle(file_path, values, chrom, track_name=None):
+    """Writes the values (index 0 is genome position 1) to a fixedStep wiggle file.
+
+    Leading and trailing NaN values are left out
+    (fixedStep wiggle files cannot have gaps)
+    and any other NaN values are written as NaN.
+    If all values are NaN (e.g., for a sample that never reaches a minimum depth),
+    only the track line is written.
+    """
+    values = np.asarray(values)
+    is_defined = ~np.isnan(values) if values.dtype.kind == 'f' else np.ones(len(values), dtype=bool)
+    lines = []
+    if track_name is not None:
+        lines.append(f'track type=wiggle_0 name="{track_name}"')
+    if np.any(is_defined):
+        first = int(np.argmax(is_defined))
+        last = len(values) - int(np.argmax(is_defined[::-1]))
+        lines.append(f'fixedStep chrom={chrom} start={first + 1} step=1')
+        lines.extend(format_value(value) for value in values[first:last])
+    with open(file_path, 'w', buffering=1 << 20) as f:
+        f.write(''.join(line + '\n' for line in lines))
+
+
+class TrackFilePath:
+    @staticmethod
+    def for_(sample_name, strand_class, extension):
+        """Returns the file path for the track of the strand class for the sample."""
+        return f'coverage_{sample_name}_{strand_class}.{extension}'
+
+
+if __name__ == '__main__':
+    print()
+
+
+    coverage_matrix_file_path = 'coverage_matrix_cy1.npz'
+    #coverage_matrix_file_path = 'coverage_matrix_cy2.npz'
+
+    print(f'{coverage_matrix_file_path=}')
+    print()
+
+
+    coverage_matrix = np.load(coverage_matrix_file_path)
+    print('Successfully loaded coverage matrix!')
+    print()
+
+
+    # bedGraph and wiggle files use the reference name as the chromosome name
+    virus = str(coverage_matrix['virus'])
+    print(f'{virus=}')
+    print()
+
+
+    for i, sample_name in enumerate(coverage_matrix['sample_names']):
+        for strand_class in strand_classes:
+            depth = coverage_matrix[strand_class][i]
+            track_name = f'{sample_name} {strand_class}'
+
+            bedgraph_file_path = TrackFilePath.for_(sample_name, strand_class, 'bedGraph')
+            write_bedgraph(bedgraph_file_path, depth, virus, track_name=track_name)
+            print(f'{bedgraph_file_path=}')
+
+            wiggle_file_path = TrackFilePath.for_(sample_name, strand_class, 'wig')
+            write_wiggle(wiggle_file_path, depth, virus, track_name=track_name)
+            print(f'{wiggle_file_path=}')
+    print()
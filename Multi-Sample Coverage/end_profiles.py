@@ -0,0 +1,192 @@
+import json
+
+import concurrent.futures
+
+import numpy as np
+
+from coverage_matrix import strand_classes, Searches, VirusHit, Hsps, StrandClasses
+
+
+class HspTable:
+    @staticmethod
+    def for_(searches, virus):
+        """Returns the hsps of the hits to the virus for the searches as flat arrays.
+
+        Also returns the strand classes of each read (as a list of lists).
+        """
+        read_indices = []
+        query_froms = []
+        hit_froms = []
+        hit_tos = []
+        read_strand_classes = []
+
+        for search in searches:
+            hit = VirusHit.for_(search, virus)
+            if hit is None:
+                continue
+            read_index = len(read_strand_classes)
+            read_strand_classes.append(StrandClasses.for_(search, hit))
+            for hsp in Hsps.for_(hit):
+                read_indices.append(read_index)
+                query_froms.append(hsp['query_from'])
+                hit_froms.append(hsp['hit_from'])
+                hit_tos.append(hsp['hit_to'])
+
+        hsp_table = {
+            'read_indices': np.array(read_indices, dtype=np.int64),
+            'query_froms': np.array(query_froms, dtype=np.int64),
+            'hit_froms': np.array(hit_froms, dtype=np.int64),
+            'hit_tos': np.array(hit_tos, dtype=np.int64),
+        }
+
+        return hsp_table, read_strand_classes
+
+
+class FirstAndLastHsps:
+    @staticmethod
+    def in_(hsp_table):
+        """Returns the indices of the first and last hsps (by query-from position) for each read.
+
+        Indices are into the flat arrays of the hsp table.
+        """
+        # sorts by read and then by query-from position
+        order = np.lexsort((hsp_table['query_froms'], hsp_table['read_indices']))
+        sorted_read_indices = hsp_table['read_indices'][order]
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = sorted_read_indices[1:] != sorted_read_indices[:-1]
+        is_last = np.ones(len(order), dtype=bool)
+        is_last[:-1] = is_first[1:]
+        return order[is_first], order[is_last]
+
+
+def sample_end_profiles(blast_output_file_path, virus, genome_length):
+    """Computes 5' start and 3' end position counts per strand class for a single sample.
+
+    The 5' start of a read is the hit-from position of its first hsp
+    and the 3' end of a read is the hit-to position of its last hsp.
+
+    Index 0 of the returned arrays is genome position 1.
+    """
+    with open(blast_output_file_path, 'r') as f:
+        blast_output = json.loads(f.read())
+
+    hsp_table, read_strand_classes = HspTable.for_(Searches.in_(blast_output), virus)
+
+    first_hsps, last_hsps = FirstAndLastHsps.in_(hsp_table)
+    starts = hsp_table['hit_froms'][first_hsps]
+    ends = hsp_table['hit_tos'][last_hsps]
+    assert np.all(1 <= starts) and np.all(starts <= genome_length)
+    assert np.all(1 <= ends) and np.all(ends <= genome_length)
+
+    end_profiles = {}
+
+    for strand_class in strand_classes:
+        is_in_class = np.array(
+            [strand_class in classes for classes in read_strand_classes],
+            dtype=bool,
+        )
+        end_profiles[f'{strand_class}_starts'] = np.bincount(
+            starts[is_in_class] - 1,
+            minlength=genome_length,
+        )
+        end_profiles[f'{strand_class}_ends'] = np.bincount(
+            ends[is_in_class] - 1,
+            minlength=genome_length,
+        )
+
+    return end_profiles
+
+
+class EndProfiles:
+    @staticmethod
+    def for_(samples, virus, genome_length, max_workers=None):
+        """Computes (samples x genome positions) 5' start and 3' end counts per strand class.
+
+        Samples are given as (sample name, BLAST output file path) pairs
+        and are processed in a process pool.
+        """
+        sample_names = [name for name, path in samples]
+        blast_output_file_paths = [path for name, path in samples]
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                sample_end_profiles,
+                blast_output_file_paths,
+                [virus] * len(samples),
+                [genome_length] * len(samples),
+            ))
+
+        return {
+            'sample_names': np.array(sample_names),
+            'blast_output_file_paths': np.array(blast_output_file_paths),
+            'virus': np.array(virus),
+            'genome_length': np.array(genome_length),
+            **{key: np.stack([result[key] for result in results]) for key in results[0]},
+        }
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+
+    print()
+
+
+    virus = 'CY1'
+    genome_length = 2692
+
+    samples = [
+        ('cy1_nb_2wpi_leaf', 'blast_output_cy1_nb_2wpi_leaf.json'),
+        ('cy1_nb_6wpi_leaf', 'blast_output_cy1_nb_6wpi_leaf.json'),
+    ]
+
+    print(f'{virus=}')
+    print(f'{genome_length=}')
+    print(f'{len(samples)=}')
+    print()
+
+
+    end_profiles_file_path = f'end_profiles_{virus.lower()}.npz'
+    print(f'{end_profiles_file_path=}')
+    print()
+
+    try:
+        end_profiles = dict(np.load(end_profiles_file_path))
+        assert list(end_profiles['sample_names']) == [name for name, path in samples]
+        print('Loaded previously computed end profiles.')
+        print()
+    except (FileNotFoundError, AssertionError):
+        end_profiles = EndProfiles.for_(samples, virus, genome_length)
+        np.savez_compressed(end_profiles_file_path, **end_profiles)
+        print('Computed and saved end profiles.')
+        print()
+
+
+    sample_index = list(end_profiles['sample_names']).index('cy1_nb_6wpi_leaf')
+
+    profile = end_profiles['plus_starts'][sample_index]
+    #profile = end_profiles['plus_ends'][sample_index]
+    #profile = end_profiles['type_i_minus_starts'][sample_index]
+    #profile = end_profiles['type_i_minus_ends'][sample_index]
+    print(f'{profile.sum()=}')
+    print()
+
+
+    fig, ax = plt.subplots()
+
+    # the same 135 bins over the range of the data as in the original histograms
+    positions = np.arange(1, genome_length + 1)[profile > 0]
+    plt.hist(
+        positions,
+        weights=profile[profile > 0],
+        bins=135,
+        color='black',
+    )
+
+    ax.set_xlim([1 - 150, genome_length + 150])
+
+    ax.set_xticks([1, 74, 281, 455, 671, 1086, 2420, 2631, 2692])
+
+    plt.xticks(rotation=90)
+
+    plt.show()
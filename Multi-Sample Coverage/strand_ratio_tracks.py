@@ -0,0 +1,118 @@
+import numpy as np
+
+from coverage_tracks import write_bedgraph, write_wiggle
+
+
+class WilsonInterval:
+    @staticmethod
+    def for_(successes, trials, z=1.96):
+        """Returns the lower and upper bounds of the Wilson score interval for the proportions.
+
+        Works elementwise on arrays of any shape.
+        Bounds are NaN where there are no trials.
+        """
+        successes = np.asarray(successes, dtype=np.float64)
+        trials = np.asarray(trials, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p = successes / trials
+            denominator = 1 + z**2 / trials
+            center = (p + z**2 / (2 * trials)) / denominator
+            half_width = z * np.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2)) / denominator
+        lower = np.clip(center - half_width, 0, 1)
+        upper = np.clip(center + half_width, 0, 1)
+        return lower, upper
+
+
+class StrandRatioTracks:
+    @staticmethod
+    def for_(coverage_matrix, min_depth=1, z=1.96):
+        """Returns the per-position minus-strand and plus-minus hybrid fractions for all samples.
+
+        Fractions are of all reads covering a position
+        (i.e., plus-strand, minus-strand and plus-minus hybrid reads)
+        and are NaN where fewer than min-depth reads cover a position.
+
+        Returned arrays have the same (samples x genome positions) shape
+        as the depth matrices of the coverage matrix.
+        """
+        total_depth = (
+            coverage_matrix['plus']
+            + coverage_matrix['minus']
+            + coverage_matrix['plus_minus_hybrid']
+        )
+        is_covered = total_depth >= max(min_depth, 1)
+
+        tracks = {'total_depth': total_depth}
+
+        for strand_class in ['minus', 'plus_minus_hybrid']:
+            depth = coverage_matrix[strand_class]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                fraction = depth / total_depth
+            lower, upper = WilsonInterval.for_(depth, total_depth, z=z)
+            tracks[f'{strand_class}_fraction'] = np.where(is_covered, fraction, np.nan)
+            tracks[f'{strand_class}_fraction_lower'] = np.where(is_covered, lower, np.nan)
+            tracks[f'{strand_class}_fraction_upper'] = np.where(is_covered, upper, np.nan)
+
+        return tracks
+
+
+if __name__ == '__main__':
+    print()
+
+
+    coverage_matrix_file_path = 'coverage_matrix_cy1.npz'
+    #coverage_matrix_file_path = 'coverage_matrix_cy2.npz'
+
+    print(f'{coverage_matrix_file_path=}')
+    print()
+
+
+    coverage_matrix = np.load(coverage_matrix_file_path)
+    print('Successfully loaded coverage matrix!')
+    print()
+
+
+    virus = str(coverage_matrix['virus'])
+    print(f'{virus=}')
+    print()
+
+
+    min_depth = 10
+    print(f'{min_depth=}')
+    print()
+
+
+    strand_ratio_tracks = StrandRatioTracks.for_(coverage_matrix, min_depth=min_depth)
+
+
+    strand_ratio_tracks_file_path = f'strand_ratio_tracks_{virus.lower()}.npz'
+    print(f'{strand_ratio_tracks_file_path=}')
+    print()
+
+    np.savez_compressed(
+        strand_ratio_tracks_file_path,
+        sample_names=coverage_matrix['sample_names'],
+        virus=coverage_matrix['virus'],
+        genome_length=coverage_matrix['genome_length'],
+        min_depth=np.array(min_depth),
+        **strand_ratio_tracks,
+    )
+    print('Saved strand ratio tracks.')
+    print()
+
+
+    track_keys = [key for key in strand_ratio_tracks if key != 'total_depth']
+
+    for i, sample_name in enumerate(coverage_matrix['sample_names']):
+        for key in track_keys:
+            track = strand_ratio_tracks[key][i]
+            track_name = f'{sample_name} {key}'
+
+            bedgraph_file_path = f'{sample_name}_{key}.bedGraph'
+            write_bedgraph(bedgraph_file_path, track, virus, track_name=track_name, skip_zeros=False)
+            print(f'{bedgraph_file_path=}')
+
+            wiggle_file_path = f'{sample_name}_{key}.wig'
+            write_wiggle(wiggle_file_path, track, virus, track_name=track_name)
+            print(f'{wiggle_file_path=}')
+    print()
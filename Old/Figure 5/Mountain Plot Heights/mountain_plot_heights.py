@@ -2,6 +2,8 @@ import json
 
 import matplotlib.pyplot as plt
 
+import numpy as np
+
 import functools
 
 
@@ -230,33 +232,139 @@ def has_minus_hit_strand(hsp):
     return hsp['hit_strand'] == 'Minus'
 
 
-class MountainPlotHeight:
+# maps dot-bracket characters to height changes
+height_changes = np.zeros(256, dtype=np.int64)
+height_changes[ord('(')] = 1
+height_changes[ord(')')] = -1
+
+# all characters other than dots and brackets are unrecognized
+is_unrecognized = np.ones(256, dtype=bool)
+is_unrecognized[[ord('('), ord(')'), ord('.')]] = False
+
+
+class MountainPlotHeights:
     @staticmethod
-    def of(folding):
-        """Returns the mountain plot height of a folding (given in dot-bracket notation)."""
-        mountain_plot_height = 0
-        h = 0
-        for c in folding:
-            if c == '(':
-                h += 1
-                mountain_plot_height = max(mountain_plot_height, h)
-            elif c == ')':
-                h -= 1
-            elif c != '.':
-                raise Exception(f'Unrecognized character in dot-bracket notation: "{c}".')
-        assert h == 0
-        return mountain_plot_height
-
-
-class NormalizedMountainPlotHeight:
+    def of(foldings):
+        """Returns the mountain plot heights of the foldings (given in dot-bracket notation).
+
+        All foldings are concatenated and their heights are taken from a single cumulative sum
+        (with the maximum taken separately for each folding).
+
+        Also returns the heights normalized to the lengths of the foldings
+        and a dictionary of diagnostics (the number of unrecognized characters,
+        the index of the first unrecognized character, the final height and the minimum height
+        of each folding), which callers should check (all should be zero, -1, zero and nonnegative).
+        """
+        lengths = np.array([len(folding) for folding in foldings], dtype=np.int64)
+        assert np.all(lengths > 0)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        ends = starts + lengths
+
+        # non-ASCII characters become "?" (and so are unrecognized)
+        characters = np.frombuffer(''.join(foldings).encode('ascii', errors='replace'), dtype=np.uint8)
+        assert len(characters) == lengths.sum()
+
+        cumulative_heights = np.cumsum(height_changes[characters])
+        # the cumulative height just before each folding
+        base_heights = np.concatenate([[0], cumulative_heights])[starts]
+
+        heights = np.maximum(np.maximum.reduceat(cumulative_heights, starts) - base_heights, 0)
+
+        unrecognized = is_unrecognized[characters]
+        positions = np.arange(len(characters)) - np.repeat(starts, lengths)
+        first_unrecognized_indices = np.minimum.reduceat(
+            np.where(unrecognized, positions, len(characters)),
+            starts,
+        )
+
+        diagnostics = {
+            'num_unrecognized_characters': np.add.reduceat(unrecognized.astype(np.int64), starts),
+            'first_unrecognized_indices': np.where(first_unrecognized_indices < lengths, first_unrecognized_indices, -1),
+            'final_heights': cumulative_heights[ends - 1] - base_heights,
+            'min_heights': np.minimum(np.minimum.reduceat(cumulative_heights, starts) - base_heights, 0),
+        }
+
+        return heights, heights / lengths, diagnostics
+
+
+class DeltaG:
     @staticmethod
-    def of(folding):
-        """Returns the normalized mountain plot height of the folding.
+    def in_(folding_line, seq_length):
+        """Returns the delta G value trailing the dot-bracket notation in a folding line.
 
-        (Normalized to the length of the folding.)
+        (E.g., "((...))  (-1.20)" with a sequence length of 7 gives -1.2.)
         """
-        assert len(folding) > 0
-        return MountainPlotHeight.of(folding) / len(folding)
+        # should have a trailing delta G value
+        assert len(folding_line) > seq_length + 3
+        assert folding_line[seq_length] == ' '
+        delta_g = folding_line[seq_length:].strip()
+        assert delta_g[0] == '(' and delta_g[-1] == ')'
+        return float(delta_g[1:-1])
+
+
+class FoldedReads:
+    @staticmethod
+    def in_(file_path, batch_size=10000):
+        """Streams the folded reads in the FASTA file and keeps only metrics for each read.
+
+        Records have three lines (read ID, read sequence and folding with a trailing delta G).
+        Foldings are reduced to mountain plot heights in batches of batch-size reads,
+        so only one batch of foldings is ever held in memory.
+
+        Returns a dictionary of arrays (read IDs, lengths, delta G values, mountain plot heights
+        and normalized mountain plot heights) and a dictionary of read indices keyed by read ID.
+        """
+        read_ids = []
+        lengths = []
+        delta_gs = []
+        heights = []
+        normalized_heights = []
+
+        foldings = []
+
+        def add_batch():
+            if len(foldings) == 0:
+                return
+            batch_heights, batch_normalized_heights, diagnostics = MountainPlotHeights.of(foldings)
+            assert np.all(diagnostics['num_unrecognized_characters'] == 0)
+            assert np.all(diagnostics['final_heights'] == 0)
+            heights.append(batch_heights)
+            normalized_heights.append(batch_normalized_heights)
+            foldings.clear()
+
+        with open(file_path, 'r') as f:
+            while True:
+                header_line = f.readline()
+                if header_line == '':
+                    break
+                seq_line = f.readline().rstrip('\n')
+                folding_line = f.readline().rstrip('\n')
+                assert header_line[0] == '>'
+                read_id = header_line[1:].rstrip('\n')
+                # should be a UUID
+                assert len(read_id) == 36
+                assert len(seq_line) > 0
+                read_ids.append(read_id)
+                lengths.append(len(seq_line))
+                delta_gs.append(DeltaG.in_(folding_line, len(seq_line)))
+                # in dot-bracket notation (without the trailing delta G)
+                foldings.append(folding_line[:len(seq_line)])
+                if len(foldings) >= batch_size:
+                    add_batch()
+            add_batch()
+
+        folded_reads = {
+            'read_ids': np.array(read_ids),
+            'lengths': np.array(lengths, dtype=np.int64),
+            'delta_gs': np.array(delta_gs),
+            'heights': np.concatenate(heights) if len(heights) > 0 else np.zeros(0, dtype=np.int64),
+            'normalized_heights': np.concatenate(normalized_heights) if len(normalized_heights) > 0 else np.zeros(0),
+        }
+
+        read_indices = {read_id: i for i, read_id in enumerate(read_ids)}
+        assert len(read_indices) == len(read_ids)
+
+        return folded_reads, read_indices
 
 
 print()
@@ -363,109 +471,82 @@ print(f'{folded_cy1_reads_file_path=}')
 print()
 
 
-cy1_read_foldings = {}
-
-with open(folded_cy1_reads_file_path, 'r') as f:
-    lines = f.read().splitlines()
-    for i in range(0, len(lines), 3):
-        assert lines[i][0] == '>'
-        read_id = lines[i][1:]
-        # should be a UUID
-        assert len(read_id) == 36
-        read_seq = lines[i + 1]
-        assert len(read_seq) > 0
-        # in dot-bracket notation
-        folding = lines[i + 2]
-        # should have a trailing delta G value
-        assert len(folding) > len(read_seq) + 3
-        assert folding[len(read_seq)] == ' '
-        # remove tailing delta G
-        folding = folding[:len(read_seq)]
-        assert len(folding) == len(read_seq)
-        cy1_read_foldings[read_id] = folding
-
-print(f'{len(cy1_read_foldings)=}')
+cy1_folded_reads, cy1_read_indices = FoldedReads.in_(folded_cy1_reads_file_path)
+print(f'{len(cy1_read_indices)=}')
 print()
 
 
 for search in searches_for_plus_strand_reads:
-    assert ReadID.for_(search) in cy1_read_foldings
+    assert ReadID.for_(search) in cy1_read_indices
 
-plus_strand_read_foldings = list(map(
-    lambda search : cy1_read_foldings[ReadID.for_(search)],
-    searches_for_plus_strand_reads,
-))
-print(f'{len(plus_strand_read_foldings)=}')
+plus_strand_read_indices = np.array(
+    [cy1_read_indices[ReadID.for_(search)] for search in searches_for_plus_strand_reads],
+    dtype=np.int64,
+)
+print(f'{len(plus_strand_read_indices)=}')
 print()
 
-plus_strand_read_norm_mtn_plot_heights = (
-    [NormalizedMountainPlotHeight.of(folding) for folding in plus_strand_read_foldings]
-)
+plus_strand_read_norm_mtn_plot_heights = cy1_folded_reads['normalized_heights'][plus_strand_read_indices]
 print(f'{len(plus_strand_read_norm_mtn_plot_heights)=}')
 print()
 
 
 for search in searches_for_plus_minus_hybrid_reads:
-    assert ReadID.for_(search) in cy1_read_foldings
+    assert ReadID.for_(search) in cy1_read_indices
 
-plus_minus_hybrid_read_foldings = list(map(
-    lambda search : cy1_read_foldings[ReadID.for_(search)],
-    searches_for_plus_minus_hybrid_reads,
-))
-print(f'{len(plus_minus_hybrid_read_foldings)=}')
+plus_minus_hybrid_read_indices = np.array(
+    [cy1_read_indices[ReadID.for_(search)] for search in searches_for_plus_minus_hybrid_reads],
+    dtype=np.int64,
+)
+print(f'{len(plus_minus_hybrid_read_indices)=}')
 print()
 
-plus_minus_hybrid_read_norm_mtn_plot_heights = (
-    [NormalizedMountainPlotHeight.of(folding) for folding in plus_minus_hybrid_read_foldings]
-)
+plus_minus_hybrid_read_norm_mtn_plot_heights = cy1_folded_reads['normalized_heights'][plus_minus_hybrid_read_indices]
 print(f'{len(plus_minus_hybrid_read_norm_mtn_plot_heights)=}')
 print()
 
 
 for search in searches_for_two_segment_plus_minus_hybrid_reads:
-    assert ReadID.for_(search) in cy1_read_foldings
+    assert ReadID.for_(search) in cy1_read_indices
 
-two_segment_plus_minus_hybrid_read_foldings = (
-    [cy1_read_foldings[ReadID.for_(search)] for search in searches_for_two_segment_plus_minus_hybrid_reads]
+two_segment_plus_minus_hybrid_read_indices = np.array(
+    [cy1_read_indices[ReadID.for_(search)] for search in searches_for_two_segment_plus_minus_hybrid_reads],
+    dtype=np.int64,
 )
-print(f'{len(two_segment_plus_minus_hybrid_read_foldings)=}')
+print(f'{len(two_segment_plus_minus_hybrid_read_indices)=}')
 print()
 
-two_segment_plus_minus_hybrid_read_norm_mtn_plot_heights = (
-    [NormalizedMountainPlotHeight.of(folding) for folding in two_segment_plus_minus_hybrid_read_foldings]
-)
+two_segment_plus_minus_hybrid_read_norm_mtn_plot_heights = cy1_folded_reads['normalized_heights'][two_segment_plus_minus_hybrid_read_indices]
 print(f'{len(two_segment_plus_minus_hybrid_read_norm_mtn_plot_heights)=}')
 print()
 
 
 for search in searches_for_type_i_minus_strand_reads:
-    assert ReadID.for_(search) in cy1_read_foldings
+    assert ReadID.for_(search) in cy1_read_indices
 
-type_i_minus_strand_read_foldings = (
-    [cy1_read_foldings[ReadID.for_(search)] for search in searches_for_type_i_minus_strand_reads]
+type_i_minus_strand_read_indices = np.array(
+    [cy1_read_indices[ReadID.for_(search)] for search in searches_for_type_i_minus_strand_reads],
+    dtype=np.int64,
 )
-print(f'{len(type_i_minus_strand_read_foldings)=}')
+print(f'{len(type_i_minus_strand_read_indices)=}')
 print()
 
-type_i_minus_strand_read_norm_mtn_plot_heights = (
-    [NormalizedMountainPlotHeight.of(folding) for folding in type_i_minus_strand_read_foldings]
-)
+type_i_minus_strand_read_norm_mtn_plot_heights = cy1_folded_reads['normalized_heights'][type_i_minus_strand_read_indices]
 print(f'{len(type_i_minus_strand_read_norm_mtn_plot_heights)=}')
 print()
 
 
 for search in searches_for_type_ii_minus_strand_reads:
-    assert ReadID.for_(search) in cy1_read_foldings
+    assert ReadID.for_(search) in cy1_read_indices
 
-type_ii_minus_strand_read_foldings = (
-    [cy1_read_foldings[ReadID.for_(search)] for search in searches_for_type_ii_minus_strand_reads]
+type_ii_minus_strand_read_indices = np.array(
+    [cy1_read_indices[ReadID.for_(search)] for search in searches_for_type_ii_minus_strand_reads],
+    dtype=np.int64,
 )
-print(f'{len(type_ii_minus_strand_read_foldings)=}')
+print(f'{len(type_ii_minus_strand_read_indices)=}')
 print()
 
-type_ii_minus_strand_read_norm_mtn_plot_heights = (
-    [NormalizedMountainPlotHeight.of(folding) for folding in type_ii_minus_strand_read_foldings]
-)
+type_ii_minus_strand_read_norm_mtn_plot_heights = cy1_folded_reads['normalized_heights'][type_ii_minus_strand_read_indices]
 print(f'{len(type_ii_minus_strand_read_norm_mtn_plot_heights)=}')
 print()
 
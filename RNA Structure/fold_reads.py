@@ -0,0 +1,195 @@
+import concurrent.futures
+
+import hashlib
+
+import json
+
+import os
+
+import subprocess
+
+import sys
+
+# the FASTQ readers are shared with the read sequence scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Read Sequences'))
+
+from fastq_index import FastqIndex
+
+from fastq_records import FastqRecords
+
+
+# RNAfold reads FASTA on stdin and writes (header, sequence, folding with delta G) records
+rnafold_command = ['RNAfold', '--noPS']
+
+# folds everything as unfolded (for testing without RNAfold)
+stub_command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_fold.py')]
+
+
+class SelectedReads:
+    @staticmethod
+    def in_(reads_file_path, read_ids):
+        """Yields the (read ID, read sequence) of each selected read in the FASTQ file (in file order).
+
+        If the FASTQ file has an index (built by fastq_index.py), only the selected records are read.
+        Otherwise, the whole file is streamed.
+        Either way, raises if any of the read IDs is not in the FASTQ file.
+        """
+        index_file_path = reads_file_path + '.fqi'
+        if os.path.exists(index_file_path):
+            # raises on missing read IDs up front
+            records = FastqIndex(index_file_path).fetch(reads_file_path, sorted(read_ids))
+        else:
+            read_id_bytes = set(read_id.encode('ascii') for read_id in read_ids)
+            records = (record for record in FastqRecords.in_(reads_file_path) if record[0] in read_id_bytes)
+        found_read_ids = set()
+        for read_id, read_seq, quality in records:
+            found_read_ids.add(read_id)
+            yield read_id.decode('ascii'), read_seq.decode('ascii')
+        assert len(found_read_ids) == len(set(read_ids)), 'Read ID not found.'
+
+
+class SeqHash:
+    @staticmethod
+    def of(read_seq):
+        return hashlib.sha1(read_seq.encode('ascii')).hexdigest()
+
+
+class CommandHash:
+    @staticmethod
+    def of(command):
+        """Returns the hash of the backend command (including its options)."""
+        return hashlib.sha1('\0'.join(command).encode('utf-8')).hexdigest()
+
+
+class FoldingCache:
+    """Foldings on disk keyed by backend command and sequence hash.
+
+    Each backend command (with its options) gets its own subdirectory, so foldings from
+    one backend (e.g., the stub) are never returned for another.
+    Within it, there is one file per sequence, in subdirectories by hash prefix.
+    """
+
+    def __init__(self, cache_dir_path, command):
+        self.command_dir_path = os.path.join(cache_dir_path, CommandHash.of(command))
+        os.makedirs(self.command_dir_path, exist_ok=True)
+        # records the command for anyone looking through the cache
+        with open(os.path.join(self.command_dir_path, 'command.txt'), 'w') as f:
+            f.write(' '.join(command) + '\n')
+
+    def file_path_for(self, seq_hash):
+        return os.path.join(self.command_dir_path, seq_hash[:2], seq_hash)
+
+    def get(self, read_seq):
+        """Returns the cached folding line for the sequence (or None if not cached)."""
+        file_path = self.file_path_for(SeqHash.of(read_seq))
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'r') as f:
+            return f.read()
+
+    def put(self, read_seq, folding_line):
+        file_path = self.file_path_for(SeqHash.of(read_seq))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # written under a temporary name first so an interrupted run does not leave a partial folding
+        temp_file_path = f'{file_path}.{os.getpid()}.tmp'
+        with open(temp_file_path, 'w') as f:
+            f.write(folding_line)
+        os.replace(temp_file_path, file_path)
+
+
+def fold_batch(command, read_seqs):
+    """Folds the sequences with the backend command and returns their folding lines (in order).
+
+    Folding lines are dot-bracket notation with a trailing delta G, e.g., "((...))  (-1.20)".
+    """
+    fasta = ''.join(f'>seq_{i}\n{read_seq}\n' for i, read_seq in enumerate(read_seqs))
+    completed = subprocess.run(command, input=fasta, capture_output=True, text=True, check=True)
+    lines = [line for line in completed.stdout.split('\n') if line != '' and not line.startswith('>')]
+    # a sequence line and a folding line for each sequence
+    assert len(lines) == 2 * len(read_seqs)
+    folding_lines = lines[1::2]
+    for read_seq, folding_line in zip(read_seqs, folding_lines):
+        assert folding_line[len(read_seq)] == ' '
+    return folding_lines
+
+
+def fold_reads(reads_file_path, read_ids, folded_reads_file_path, cache_dir_path, command=rnafold_command, batch_size=100, max_workers=None):
+    """Folds the selected reads in the FASTQ file and writes them to a folded-read FASTA file.
+
+    Records have three lines (read ID, read sequence and folding with a trailing delta G),
+    as expected by the mountain plot code.
+    Foldings are looked up in the cache (for the command) first and only the remaining sequences are
+    dispatched in batches to the backend command in a process pool.
+
+    Returns the number of reads folded and the number of reads found in the cache.
+    """
+    cache = FoldingCache(cache_dir_path, command)
+
+    selected_reads = list(SelectedReads.in_(reads_file_path, read_ids))
+    folding_lines = [cache.get(read_seq) for read_id, read_seq in selected_reads]
+    num_cached = sum(folding_line is not None for folding_line in folding_lines)
+
+    # each distinct uncached sequence is folded once
+    uncached_seqs = list(dict.fromkeys(
+        read_seq
+        for (read_id, read_seq), folding_line in zip(selected_reads, folding_lines)
+        if folding_line is None
+    ))
+    batches = [uncached_seqs[i:i + batch_size] for i in range(0, len(uncached_seqs), batch_size)]
+
+    new_folding_lines = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for read_seqs, batch_folding_lines in zip(batches, executor.map(fold_batch, [command] * len(batches), batches)):
+            for read_seq, folding_line in zip(read_seqs, batch_folding_lines):
+                cache.put(read_seq, folding_line)
+                new_folding_lines[read_seq] = folding_line
+
+    with open(folded_reads_file_path, 'w', buffering=1 << 20) as f:
+        for (read_id, read_seq), folding_line in zip(selected_reads, folding_lines):
+            if folding_line is None:
+                folding_line = new_folding_lines[read_seq]
+            f.write(f'>{read_id}\n{read_seq}\n{folding_line}\n')
+
+    return len(selected_reads) - num_cached, num_cached
+
+
+if __name__ == '__main__':
+    print()
+
+
+    blast_output_file_path = 'blast_output_cy1_nb_6wpi_leaf.json'
+    print(f'{blast_output_file_path=}')
+    print()
+
+    reads_file_path = 'all_reads_cy1_nb_6wpi_leaf.fastq'
+    print(f'{reads_file_path=}')
+    print()
+
+
+    with open(blast_output_file_path, 'r') as f:
+        blast_output = json.loads(f.read())
+    print('Successfully parsed BLAST output.')
+    print()
+
+    read_ids = set(
+        item['report']['results']['search']['query_title']
+        for item in blast_output['BlastOutput2']
+        if len(item['report']['results']['search']['hits']) > 0
+    )
+    print(f'{len(read_ids)=}')
+    print()
+
+
+    folded_reads_file_path = 'folded_cy1_reads_' + reads_file_path.removeprefix('all_reads_').removesuffix('.fastq') + '.fasta'
+    print(f'{folded_reads_file_path=}')
+    print()
+
+    cache_dir_path = 'folding_cache'
+
+    command = rnafold_command
+    #command = stub_command
+
+    num_folded, num_cached = fold_reads(reads_file_path, read_ids, folded_reads_file_path, cache_dir_path, command=command)
+    print(f'{num_folded=}')
+    print(f'{num_cached=}')
+    print()
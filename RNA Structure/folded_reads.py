@@ -0,0 +1,51 @@
+class DeltaG:
+    @staticmethod
+    def in_(folding_line, seq_length):
+        """Returns the delta G value trailing the dot-bracket notation in a folding line.
+
+        (E.g., "((...))  (-1.20)" with a sequence length of 7 gives -1.2.)
+        """
+        # should have a trailing delta G value
+        assert len(folding_line) > seq_length + 3
+        assert folding_line[seq_length] == ' '
+        delta_g = folding_line[seq_length:].strip()
+        assert delta_g[0] == '(' and delta_g[-1] == ')'
+        return float(delta_g[1:-1])
+
+
+class FoldedReadBatches:
+    @staticmethod
+    def in_(file_path, batch_size=10000):
+        """Yields batches of folded reads from the FASTA file.
+
+        Records have three lines (read ID, read sequence and folding with a trailing delta G).
+        Each batch is a (read IDs, read lengths, delta G values, foldings) tuple of lists,
+        with foldings in dot-bracket notation (without the trailing delta G).
+        """
+        read_ids = []
+        lengths = []
+        delta_gs = []
+        foldings = []
+
+        with open(file_path, 'r') as f:
+            while True:
+                header_line = f.readline()
+                if header_line == '':
+                    break
+                seq_line = f.readline().rstrip('\n')
+                folding_line = f.readline().rstrip('\n')
+                assert header_line[0] == '>'
+                read_id = header_line[1:].rstrip('\n')
+                # should be a UUID
+                assert len(read_id) == 36
+                assert len(seq_line) > 0
+                read_ids.append(read_id)
+                lengths.append(len(seq_line))
+                delta_gs.append(DeltaG.in_(folding_line, len(seq_line)))
+                foldings.append(folding_line[:len(seq_line)])
+                if len(foldings) >= batch_size:
+                    yield read_ids, lengths, delta_gs, foldings
+                    read_ids, lengths, delta_gs, foldings = [], [], [], []
+
+        if len(foldings) > 0:
+            yield read_ids, lengths, delta_gs, foldings
@@ -0,0 +1,194 @@
+import json
+
+import numpy as np
+
+from folded_reads import FoldedReadBatches
+
+from structure_metrics import height_changes, is_unrecognized, ReadClass
+
+
+profile_classes = ['plus', 'type_i_minus', 'type_ii_minus', 'two_segment_plus_minus_hybrid']
+
+
+class MountainProfiles:
+    @staticmethod
+    def of(foldings, num_bins=100):
+        """Returns the mountain plot profiles of the foldings resampled onto a fixed number of bins.
+
+        The profile of a folding of length L is its height after each of its positions
+        (starting from a height of zero before the first position), divided by L,
+        against position divided by L. It is linearly interpolated at the bin centers,
+        for all foldings at once.
+
+        Also returns whether each folding is valid (only dots and brackets, and balanced);
+        rows of invalid foldings are NaN.
+        """
+        num_foldings = len(foldings)
+        lengths = np.array([len(folding) for folding in foldings], dtype=np.int64)
+        assert np.all(lengths > 0)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+        characters = np.frombuffer(''.join(foldings).encode('ascii', errors='replace'), dtype=np.uint8)
+        assert len(characters) == lengths.sum()
+        folding_indices = np.repeat(np.arange(num_foldings), lengths)
+
+        cumulative_heights = np.cumsum(height_changes[characters])
+        base_heights = np.concatenate([[0], cumulative_heights])[starts]
+        heights = cumulative_heights - base_heights[folding_indices]
+
+        is_valid = (np.add.reduceat(is_unrecognized[characters].astype(np.int64), starts) == 0) \
+            & (heights[starts + lengths - 1] == 0) \
+            & (np.minimum.reduceat(heights, starts) >= 0)
+
+        # each folding gets a leading zero height (so folding i starts at starts[i] + i)
+        profile_starts = starts + np.arange(num_foldings)
+        profile_heights = np.zeros(len(characters) + num_foldings, dtype=np.float64)
+        profile_heights[np.arange(len(characters)) + folding_indices + 1] = heights / lengths[folding_indices]
+
+        bin_centers = (np.arange(num_bins) + 0.5) / num_bins
+        positions = bin_centers[np.newaxis, :] * lengths[:, np.newaxis]
+        left_positions = np.minimum(np.floor(positions).astype(np.int64), lengths[:, np.newaxis] - 1)
+        fractions = positions - left_positions
+        left_indices = profile_starts[:, np.newaxis] + left_positions
+        profiles = (1 - fractions) * profile_heights[left_indices] + fractions * profile_heights[left_indices + 1]
+
+        profiles[~is_valid] = np.nan
+        return profiles, is_valid
+
+
+class MountainProfileSummary:
+    """Streaming mean, standard deviation and quantiles of mountain profiles (for each bin).
+
+    Quantiles come from a histogram of profile heights on a fixed grid for each bin,
+    so only the sums and histograms are held in memory (not the profiles).
+    """
+
+    def __init__(self, num_bins=100, max_height=0.5, num_height_bins=500):
+        self.num_bins = num_bins
+        self.max_height = max_height
+        self.num_height_bins = num_height_bins
+        self.count = 0
+        self.sums = np.zeros(num_bins)
+        self.sums_of_squares = np.zeros(num_bins)
+        self.histograms = np.zeros((num_bins, num_height_bins), dtype=np.int64)
+
+    def add(self, profiles):
+        """Adds the profiles (one row per folding) to the summary."""
+        assert profiles.shape[1] == self.num_bins
+        self.count += len(profiles)
+        self.sums += profiles.sum(axis=0)
+        self.sums_of_squares += (profiles ** 2).sum(axis=0)
+        height_bins = np.clip((profiles / self.max_height * self.num_height_bins).astype(np.int64), 0, self.num_height_bins - 1)
+        flat_indices = np.arange(self.num_bins)[np.newaxis, :] * self.num_height_bins + height_bins
+        self.histograms += np.bincount(flat_indices.ravel(), minlength=self.num_bins * self.num_height_bins).reshape(self.num_bins, self.num_height_bins)
+
+    def means(self):
+        return self.sums / self.count
+
+    def stds(self):
+        return np.sqrt(np.maximum(self.sums_of_squares / self.count - self.means() ** 2, 0))
+
+    def quantiles(self, q):
+        """Returns the q quantile of each bin (interpolated linearly within the height grid)."""
+        cumulative_counts = np.cumsum(self.histograms, axis=1)
+        target = q * self.count
+        height_bins = np.minimum((cumulative_counts < target).sum(axis=1), self.num_height_bins - 1)
+        counts_before = np.where(height_bins > 0, cumulative_counts[np.arange(self.num_bins), height_bins - 1], 0)
+        counts_in = self.histograms[np.arange(self.num_bins), height_bins]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fractions = np.where(counts_in > 0, (target - counts_before) / counts_in, 0)
+        height_bin_width = self.max_height / self.num_height_bins
+        return (height_bins + np.clip(fractions, 0, 1)) * height_bin_width
+
+
+class ClassMountainProfileSummaries:
+    @staticmethod
+    def for_(folded_reads_file_path, read_classes, num_bins=100, batch_size=10000):
+        """Returns a dictionary of mountain profile summaries (keyed by read class) for the folded reads in the file.
+
+        Read classes are given as a dictionary keyed by read ID (reads in other classes or without a class are skipped).
+        Also returns the number of invalid foldings skipped.
+        """
+        summaries = {read_class: MountainProfileSummary(num_bins=num_bins) for read_class in profile_classes}
+        num_invalid = 0
+
+        for read_ids, lengths, delta_gs, foldings in FoldedReadBatches.in_(folded_reads_file_path, batch_size=batch_size):
+            profiles, is_valid = MountainProfiles.of(foldings, num_bins=num_bins)
+            num_invalid += int((~is_valid).sum())
+            classes = np.array([read_classes.get(read_id, '') for read_id in read_ids])
+            for read_class in profile_classes:
+                summaries[read_class].add(profiles[is_valid & (classes == read_class)])
+
+        return summaries, num_invalid
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+
+    print()
+
+
+    blast_output_file_path = 'blast_output_cy1_nb_6wpi_leaf.json'
+    print(f'{blast_output_file_path=}')
+    print()
+
+    folded_reads_file_path = 'folded_cy1_reads_cy1_nb_6wpi_leaf.fasta'
+    print(f'{folded_reads_file_path=}')
+    print()
+
+
+    with open(blast_output_file_path, 'r') as f:
+        blast_output = json.loads(f.read())
+    print('Successfully parsed BLAST output.')
+    print()
+
+    read_classes = {
+        item['report']['results']['search']['query_title']: ReadClass.for_(item['report']['results']['search'])
+        for item in blast_output['BlastOutput2']
+        if len(item['report']['results']['search']['hits']) > 0
+    }
+
+
+    num_bins = 100
+
+    summaries, num_invalid = ClassMountainProfileSummaries.for_(folded_reads_file_path, read_classes, num_bins=num_bins)
+    print(f'{num_invalid=}')
+    for read_class, summary in summaries.items():
+        print(f'{read_class}: {summary.count} reads')
+    print()
+
+
+    mountain_profiles_file_path = 'mountain_profiles_' + folded_reads_file_path.removeprefix('folded_').removesuffix('.fasta') + '.npz'
+    print(f'{mountain_profiles_file_path=}')
+    print()
+
+    np.savez(
+        mountain_profiles_file_path,
+        bin_centers=(np.arange(num_bins) + 0.5) / num_bins,
+        read_classes=np.array(profile_classes),
+        counts=np.array([summaries[read_class].count for read_class in profile_classes]),
+        means=np.array([summaries[read_class].means() for read_class in profile_classes]),
+        stds=np.array([summaries[read_class].stds() for read_class in profile_classes]),
+        lower_quartiles=np.array([summaries[read_class].quantiles(0.25) for read_class in profile_classes]),
+        medians=np.array([summaries[read_class].quantiles(0.5) for read_class in profile_classes]),
+        upper_quartiles=np.array([summaries[read_class].quantiles(0.75) for read_class in profile_classes]),
+    )
+
+
+    bin_centers = (np.arange(num_bins) + 0.5) / num_bins
+
+    fig, ax = plt.subplots()
+
+    for read_class in profile_classes:
+        summary = summaries[read_class]
+        if summary.count == 0:
+            continue
+        line, = ax.plot(bin_centers, summary.means(), label=f'{read_class} ({summary.count})')
+        ax.fill_between(bin_centers, summary.quantiles(0.25), summary.quantiles(0.75), color=line.get_color(), alpha=0.2)
+
+    ax.set_xlabel('position / read length')
+    ax.set_ylabel('mountain plot height / read length')
+    ax.legend()
+
+    plt.show()
@@ -0,0 +1,298 @@
+import json
+
+import functools
+
+import numpy as np
+
+from folded_reads import FoldedReadBatches
+
+
+# maps dot-bracket characters to height changes
+height_changes = np.zeros(256, dtype=np.int64)
+height_changes[ord('(')] = 1
+height_changes[ord(')')] = -1
+
+# all characters other than dots and brackets are unrecognized
+is_unrecognized = np.ones(256, dtype=bool)
+is_unrecognized[[ord('('), ord(')'), ord('.')]] = False
+
+
+metric_names = [
+    'num_base_pairs',
+    'paired_fraction',
+    'longest_helix',
+    'num_stems',
+    'num_hairpins',
+    'max_pairing_span',
+    'mean_pairing_distance',
+    'mountain_plot_height',
+]
+
+
+class BasePairs:
+    @staticmethod
+    def in_(characters, folding_indices, heights):
+        """Returns the (opening positions, closing positions) of all base pairs in the concatenated foldings.
+
+        Positions are into the concatenated foldings and pairs are sorted by opening position.
+        The foldings must be balanced.
+
+        Opening brackets and closing brackets at the same height alternate within a folding,
+        so the nth opening bracket that rises to a height pairs with the nth closing bracket
+        that falls from it (and sorting both by folding, height and position lines them up).
+        """
+        openings = np.flatnonzero(characters == ord('('))
+        closings = np.flatnonzero(characters == ord(')'))
+        opening_order = np.lexsort((openings, heights[openings], folding_indices[openings]))
+        # the height before a closing bracket
+        closing_order = np.lexsort((closings, heights[closings] + 1, folding_indices[closings]))
+        pairs = np.empty(len(openings), dtype=np.int64)
+        pairs[opening_order] = closings[closing_order]
+        return openings, pairs
+
+
+class StructureMetrics:
+    @staticmethod
+    def of(foldings):
+        """Returns a dictionary of structure metrics (keyed by metric name) for the foldings.
+
+        Metrics are computed for all foldings at once:
+            the number of base pairs,
+            the paired fraction (of positions),
+            the longest helix (the most base pairs stacked directly on top of each other),
+            the number of stems (helices of stacked base pairs),
+            the number of hairpins (base pairs enclosing no other base pairs),
+            the maximum pairing span (the most positions enclosed by a base pair, inclusive),
+            the mean pairing distance (j - i for base pairs (i, j)),
+            and the mountain plot height.
+
+        Metrics are NaN for foldings with unrecognized characters or that are not balanced.
+        """
+        num_foldings = len(foldings)
+        lengths = np.array([len(folding) for folding in foldings], dtype=np.int64)
+        assert np.all(lengths > 0)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+        characters = np.frombuffer(''.join(foldings).encode('ascii', errors='replace'), dtype=np.uint8)
+        assert len(characters) == lengths.sum()
+        folding_indices = np.repeat(np.arange(num_foldings), lengths)
+
+        cumulative_heights = np.cumsum(height_changes[characters])
+        base_heights = np.concatenate([[0], cumulative_heights])[starts]
+        heights = cumulative_heights - base_heights[folding_indices]
+
+        is_valid = (np.add.reduceat(is_unrecognized[characters].astype(np.int64), starts) == 0) \
+            & (heights[starts + lengths - 1] == 0) \
+            & (np.minimum.reduceat(heights, starts) >= 0)
+
+        # leaves out the characters of invalid foldings
+        characters = np.where(is_valid[folding_indices], characters, ord('.'))
+
+        openings, closings = BasePairs.in_(characters, folding_indices, heights)
+        pair_folding_indices = folding_indices[openings]
+
+        num_base_pairs = np.bincount(pair_folding_indices, minlength=num_foldings)
+
+        spans = closings - openings + 1
+        max_pairing_spans = np.zeros(num_foldings, dtype=np.int64)
+        np.maximum.at(max_pairing_spans, pair_folding_indices, spans)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_pairing_distances = np.bincount(
+                pair_folding_indices,
+                weights=closings - openings,
+                minlength=num_foldings,
+            ) / num_base_pairs
+
+        # base pairs (i, j) and (i + 1, j - 1) are stacked
+        is_stacked = np.zeros(len(openings), dtype=bool)
+        is_stacked[1:] = (openings[1:] == openings[:-1] + 1) & (closings[1:] == closings[:-1] - 1)
+        helix_starts = np.flatnonzero(~is_stacked)
+        helix_lengths = np.diff(np.concatenate([helix_starts, [len(openings)]]))
+        helix_folding_indices = pair_folding_indices[helix_starts]
+        num_stems = np.bincount(helix_folding_indices, minlength=num_foldings)
+        longest_helices = np.zeros(num_foldings, dtype=np.int64)
+        np.maximum.at(longest_helices, helix_folding_indices, helix_lengths)
+
+        # an opening bracket followed directly (ignoring dots) by a closing bracket closes a hairpin
+        brackets = np.flatnonzero(characters != ord('.'))
+        is_hairpin = (characters[brackets[:-1]] == ord('(')) \
+            & (characters[brackets[1:]] == ord(')')) \
+            & (folding_indices[brackets[:-1]] == folding_indices[brackets[1:]])
+        num_hairpins = np.bincount(folding_indices[brackets[:-1][is_hairpin]], minlength=num_foldings)
+
+        mountain_plot_heights = np.maximum(np.maximum.reduceat(heights, starts), 0)
+
+        metrics = {
+            'num_base_pairs': num_base_pairs,
+            'paired_fraction': 2 * num_base_pairs / lengths,
+            'longest_helix': longest_helices,
+            'num_stems': num_stems,
+            'num_hairpins': num_hairpins,
+            'max_pairing_span': max_pairing_spans,
+            'mean_pairing_distance': mean_pairing_distances,
+            'mountain_plot_height': mountain_plot_heights,
+        }
+
+        return {
+            name: np.where(is_valid, metric.astype(np.float64), np.nan)
+            for name, metric in metrics.items()
+        }
+
+
+class FoldedReadMetrics:
+    @staticmethod
+    def in_(folded_reads_file_path, batch_size=10000):
+        """Returns the read IDs, lengths, delta G values and structure metrics of all folded reads in the file.
+
+        Foldings are streamed in batches, so only one batch of foldings is held in memory.
+        """
+        read_ids = []
+        lengths = []
+        delta_gs = []
+        metrics = {name: [] for name in metric_names}
+
+        for batch_read_ids, batch_lengths, batch_delta_gs, foldings in FoldedReadBatches.in_(folded_reads_file_path, batch_size=batch_size):
+            read_ids.extend(batch_read_ids)
+            lengths.extend(batch_lengths)
+            delta_gs.extend(batch_delta_gs)
+            for name, metric in StructureMetrics.of(foldings).items():
+                metrics[name].append(metric)
+
+        return {
+            'read_ids': np.array(read_ids),
+            'lengths': np.array(lengths, dtype=np.int64),
+            'delta_gs': np.array(delta_gs),
+            **{name: np.concatenate(metric) if len(metric) > 0 else np.zeros(0) for name, metric in metrics.items()},
+        }
+
+
+def cmp_query_froms(hsp1, hsp2):
+    return hsp1['query_from'] - hsp2['query_from']
+
+
+class ReadClass:
+    @staticmethod
+    def for_(search):
+        """Returns the class of the read for the search.
+
+        Classes are plus, type_i_minus, type_ii_minus, other_minus, two_segment_plus_minus_hybrid
+        and other_plus_minus_hybrid (two-segment hybrids and type II minus-strand reads are foldbacks).
+        """
+        hits = search['hits']
+        assert len(hits) == 1
+        hsps = hits[0]['hsps']
+        assert len(hsps) > 0
+        hit_strands = set(hsp['hit_strand'] for hsp in hsps)
+        if hit_strands == {'Plus'}:
+            return 'plus'
+        elif hit_strands == {'Minus'}:
+            first_hsp = sorted(hsps, key=functools.cmp_to_key(cmp_query_froms))[0]
+            query_fraction = first_hsp['query_from'] / search['query_len']
+            if query_fraction <= 0.05:
+                return 'type_i_minus'
+            elif 0.4 <= query_fraction <= 0.53:
+                return 'type_ii_minus'
+            else:
+                return 'other_minus'
+        elif len(hsps) == 2:
+            return 'two_segment_plus_minus_hybrid'
+        else:
+            return 'other_plus_minus_hybrid'
+
+
+def is_foldback_class(read_class):
+    return read_class in ['type_ii_minus', 'two_segment_plus_minus_hybrid']
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+
+    print()
+
+
+    blast_output_file_path = 'blast_output_cy1_nb_6wpi_leaf.json'
+    print(f'{blast_output_file_path=}')
+    print()
+
+    folded_reads_file_path = 'folded_cy1_reads_cy1_nb_6wpi_leaf.fasta'
+    print(f'{folded_reads_file_path=}')
+    print()
+
+
+    folded_read_metrics = FoldedReadMetrics.in_(folded_reads_file_path)
+    print(f'{len(folded_read_metrics["read_ids"])=}')
+    print(f'{np.isnan(folded_read_metrics["num_base_pairs"]).sum()=}')
+    print()
+
+
+    with open(blast_output_file_path, 'r') as f:
+        blast_output = json.loads(f.read())
+    print('Successfully parsed BLAST output.')
+    print()
+
+    searches_with_a_hit = [
+        item['report']['results']['search']
+        for item in blast_output['BlastOutput2']
+        if len(item['report']['results']['search']['hits']) > 0
+    ]
+    read_classes = {search['query_title']: ReadClass.for_(search) for search in searches_with_a_hit}
+    print(f'{len(read_classes)=}')
+    print()
+
+
+    classes = np.array([read_classes.get(read_id, 'unclassified') for read_id in folded_read_metrics['read_ids']])
+    is_foldback = np.array([is_foldback_class(read_class) for read_class in classes])
+
+
+    structure_metrics_file_path = 'structure_metrics_' + folded_reads_file_path.removeprefix('folded_').removesuffix('.fasta') + '.tsv'
+    print(f'{structure_metrics_file_path=}')
+    print()
+
+    with open(structure_metrics_file_path, 'w', buffering=1 << 20) as f:
+        f.write('\t'.join(['read_id', 'length', 'delta_g', *metric_names, 'read_class', 'is_foldback']) + '\n')
+        for i, read_id in enumerate(folded_read_metrics['read_ids']):
+            f.write('\t'.join([
+                read_id,
+                str(folded_read_metrics['lengths'][i]),
+                str(folded_read_metrics['delta_gs'][i]),
+                *[f'{folded_read_metrics[name][i]:.6g}' for name in metric_names],
+                classes[i],
+                str(int(is_foldback[i])),
+            ]) + '\n')
+
+
+    for read_class in np.unique(classes):
+        is_in_class = classes == read_class
+        print(f'{read_class} ({is_in_class.sum()} reads):')
+        for name in metric_names:
+            print(f'    median {name} = {np.nanmedian(folded_read_metrics[name][is_in_class]):.4g}')
+    print()
+
+
+    metric_name = 'paired_fraction'
+    #metric_name = 'longest_helix'
+    #metric_name = 'max_pairing_span'
+    #metric_name = 'mean_pairing_distance'
+
+
+    fig, ax = plt.subplots()
+
+    parts = plt.violinplot(
+        [
+            folded_read_metrics[metric_name][~is_foldback & (classes != 'unclassified')],
+            folded_read_metrics[metric_name][is_foldback],
+        ],
+        showextrema=False,
+    )
+
+    for pc in parts['bodies']:
+        pc.set_facecolor('black')
+        pc.set_edgecolor('black')
+        pc.set_alpha(1)
+
+    ax.set_xticks([1, 2])
+    ax.set_xticklabels(['not foldback', 'foldback'])
+
+    plt.show()
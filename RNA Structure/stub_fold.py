@@ -0,0 +1,19 @@
+"""Stub folding backend for testing the folding stage without RNAfold.
+
+Reads FASTA records from stdin and writes them in RNAfold's output format
+with an unfolded (all dots) structure and a delta G of 0.
+"""
+
+import sys
+
+
+if __name__ == '__main__':
+    header_line = None
+    for line in sys.stdin:
+        line = line.rstrip('\n')
+        if line.startswith('>'):
+            header_line = line
+            continue
+        if line == '':
+            continue
+        sys.stdout.write(f'{header_line}\n{line}\n{"." * len(line)} (  0.00)\n')
@@ -0,0 +1,207 @@
+import json
+
+import mmap
+
+import os
+
+import numpy as np
+
+from fastq_index import FastqIndex
+
+
+class Searches:
+    @staticmethod
+    def in_(blast_output):
+        """Returns all searches in the BLAST output."""
+        return [item['report']['results']['search'] for item in blast_output['BlastOutput2']]
+
+
+class ReadID:
+    @staticmethod
+    def for_(search):
+        """Returns the ID of the read for the search."""
+        read_id = search['query_title']
+        assert type(read_id) == str
+        # all read IDs should be UUIDs
+        assert len(read_id) == 36
+        return read_id
+
+
+class ReadLength:
+    @staticmethod
+    def for_(search):
+        """Returns the length of the read for the search."""
+        read_length = search['query_len']
+        assert type(read_length) == int
+        assert read_length > 0
+        return read_length
+
+
+class Hit:
+    @staticmethod
+    def for_(search):
+        """Returns the single hit for the search.
+
+        Raises if the search does not have exactly one hit.
+        """
+        hits = search['hits']
+        assert len(hits) == 1
+        return hits[0]
+
+
+class StrandClass:
+    @staticmethod
+    def of(hit):
+        """Returns the strand class (plus, minus or plus_minus_hybrid) of the hit."""
+        hit_strands = set(hsp['hit_strand'] for hsp in hit['hsps'])
+        if hit_strands == {'Plus'}:
+            return 'plus'
+        elif hit_strands == {'Minus'}:
+            return 'minus'
+        else:
+            return 'plus_minus_hybrid'
+
+
+class AlignedQueryIntervals:
+    @staticmethod
+    def for_(hit):
+        """Returns the merged, inclusive query intervals aligned in the hsps of the hit (sorted)."""
+        intervals = sorted([
+            (min(hsp['query_from'], hsp['query_to']), max(hsp['query_from'], hsp['query_to']))
+            for hsp in hit['hsps']
+        ])
+        assert len(intervals) > 0
+        merged = [list(intervals[0])]
+        for start, end in intervals[1:]:
+            if start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+
+class UnalignedSegments:
+    @staticmethod
+    def for_(search, min_length=1):
+        """Returns the (segment, start, end) unaligned segments of the read for the search.
+
+        Segments are the 5' overhang, any inner gaps between hsps and the 3' overhang.
+        Start and end are 1-based and inclusive read positions (as for BLAST query positions).
+        Segments shorter than min-length are left out.
+        """
+        read_length = ReadLength.for_(search)
+        intervals = AlignedQueryIntervals.for_(Hit.for_(search))
+        segments = [('five_prime_overhang', 1, intervals[0][0] - 1)]
+        for (start1, end1), (start2, end2) in zip(intervals[:-1], intervals[1:]):
+            segments.append(('inner_gap', end1 + 1, start2 - 1))
+        segments.append(('three_prime_overhang', intervals[-1][1] + 1, read_length))
+        return [
+            (segment, start, end)
+            for segment, start, end in segments
+            if end - start + 1 >= max(min_length, 1)
+        ]
+
+
+def write_segments(searches, reads_file_path, fastq_index, segments_file_path, min_length=20):
+    """Writes the unaligned segments of the reads for the searches to a FASTA file.
+
+    Sequences are sliced straight out of the memory-mapped FASTQ file
+    (without being copied) and written in large buffered blocks.
+
+    Returns the number of segments written for each kind of segment.
+    """
+    read_ids = [ReadID.for_(search) for search in searches]
+    offsets, lengths = fastq_index.spans_of(read_ids)
+
+    # in the order of the FASTQ file
+    order = np.argsort(offsets, kind='stable')
+
+    num_segments = {'five_prime_overhang': 0, 'inner_gap': 0, 'three_prime_overhang': 0}
+
+    with open(reads_file_path, 'rb') as reads_file:
+        with mmap.mmap(reads_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_reads:
+            with memoryview(mapped_reads) as reads, open(segments_file_path, 'wb', buffering=1 << 23) as f:
+                for i in order:
+                    search = searches[i]
+                    read_id = read_ids[i]
+                    read_length = ReadLength.for_(search)
+                    hit = Hit.for_(search)
+
+                    seq_offset = mapped_reads.find(b'\n', int(offsets[i])) + 1
+                    assert mapped_reads[seq_offset + read_length:seq_offset + read_length + 1] == b'\n'
+
+                    for segment, start, end in UnalignedSegments.for_(search, min_length=min_length):
+                        f.write((
+                            f'>{read_id}:{start}-{end}'
+                            f' segment={segment}'
+                            f' read_length={read_length}'
+                            f' hit={hit["description"][0]["title"]}'
+                            f' strand_class={StrandClass.of(hit)}'
+                            f' num_hsps={len(hit["hsps"])}\n'
+                        ).encode('ascii'))
+                        f.write(reads[seq_offset + start - 1:seq_offset + end])
+                        f.write(b'\n')
+                        num_segments[segment] += 1
+
+    return num_segments
+
+
+if __name__ == '__main__':
+    print()
+
+
+    blast_output_file_path = 'blast_output_cy1_nb_6wpi_leaf.json'
+    #blast_output_file_path = 'blast_to_rubisco_large_output_cy1_nb_2wpi_leaf.json'
+
+    print(f'{blast_output_file_path=}')
+    print()
+
+
+    reads_file_path = 'all_reads_cy1_nb_6wpi_leaf.fastq'
+    #reads_file_path = 'all_reads_cy1_nb_2wpi_leaf.fastq'
+
+    print(f'{reads_file_path=}')
+    print()
+
+
+    with open(blast_output_file_path, 'r') as f:
+        blast_output = json.loads(f.read())
+    print('Successfully parsed BLAST output.')
+    print()
+
+
+    searches_with_a_hit = [search for search in Searches.in_(blast_output) if len(search['hits']) > 0]
+    print(f'{len(searches_with_a_hit)=}')
+    print()
+
+    assert all(len(search['hits']) == 1 for search in searches_with_a_hit)
+    print('All searches have at most one hit.')
+    print()
+
+
+    index_file_path = reads_file_path + '.fqi'
+    if not os.path.exists(index_file_path):
+        FastqIndex.build(reads_file_path, index_file_path)
+    fastq_index = FastqIndex(index_file_path)
+    print(f'{len(fastq_index)=}')
+    print()
+
+
+    min_length = 20
+    print(f'{min_length=}')
+    print()
+
+
+    segments_file_path = 'unaligned_segments_' + os.path.splitext(blast_output_file_path)[0] + '.fasta'
+    print(f'{segments_file_path=}')
+    print()
+
+    num_segments = write_segments(
+        searches_with_a_hit,
+        reads_file_path,
+        fastq_index,
+        segments_file_path,
+        min_length=min_length,
+    )
+    print(f'{num_segments=}')
+    print()
@@ -0,0 +1,155 @@
+import numpy as np
+
+from fastq_records import FastqChunks
+
+from pack_reads import ReadIDBytes
+
+
+class FastqRecordSpans:
+    @staticmethod
+    def in_(file_path, chunk_size=1 << 24):
+        """Yields the (read ID, record offset, record length) of each record in the FASTQ file.
+
+        Offsets and lengths are in bytes and cover all four lines of a record
+        (including the newline at the end of the quality line).
+        The file is read once, in chunks of about chunk-size bytes.
+        """
+        for records in FastqChunks.in_(file_path, chunk_size=chunk_size, with_spans=True):
+            for read_id, read_seq, quality, offset, record_length in records:
+                yield read_id, offset, record_length
+
+
+class FastqIndex:
+    """A read ID index of the byte offsets of the records in a FASTQ file."""
+
+    def __init__(self, index_file_path):
+        index = np.load(index_file_path)
+        # sorted
+        self.ids = index['ids']
+        self.offsets = index['offsets']
+        self.lengths = index['lengths']
+
+    @staticmethod
+    def build(reads_file_path, index_file_path):
+        """Builds the index for the FASTQ file in a single pass and saves it to the index file."""
+        ids = []
+        offsets = []
+        lengths = []
+        for read_id, offset, length in FastqRecordSpans.in_(reads_file_path):
+            ids.append(ReadIDBytes.of(read_id))
+            offsets.append(offset)
+            lengths.append(length)
+
+        ids = np.array(ids, dtype='S16')
+        order = np.argsort(ids, kind='stable')
+        assert np.all(ids[order][1:] != ids[order][:-1]), 'Read IDs must be unique.'
+
+        with open(index_file_path, 'wb') as f:
+            np.savez(
+                f,
+                ids=ids[order],
+                offsets=np.array(offsets, dtype=np.int64)[order],
+                lengths=np.array(lengths, dtype=np.int64)[order],
+            )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def spans_of(self, read_ids):
+        """Returns the record offsets and lengths for the reads with the given IDs.
+
+        Raises if any of the read IDs is not in the index.
+        """
+        ids = np.array([ReadIDBytes.of(read_id) for read_id in read_ids], dtype='S16')
+        positions = np.searchsorted(self.ids, ids)
+        assert np.all(positions < len(self.ids))
+        assert np.all(self.ids[positions] == ids), 'Read ID not found.'
+        return self.offsets[positions], self.lengths[positions]
+
+    def fetch(self, reads_file_path, read_ids, max_gap=1 << 20, max_block_size=1 << 26):
+        """Yields the (read ID, read sequence, quality) records for the reads with the given IDs.
+
+        Records are yielded in the order that they appear in the FASTQ file (and as bytes).
+        Nearby records are read together in large blocks,
+        so a few thousand reads only take a handful of reads from disk.
+        """
+        if len(read_ids) == 0:
+            return
+
+        offsets, lengths = self.spans_of(read_ids)
+        order = np.argsort(offsets, kind='stable')
+        offsets = offsets[order]
+        ends = offsets + lengths[order]
+
+        # starts a new block wherever the gap to the previous record is too big
+        # or the block would get too big
+        block_starts = [0]
+        for i in range(1, len(offsets)):
+            if offsets[i] - ends[i - 1] > max_gap or ends[i] - offsets[block_starts[-1]] > max_block_size:
+                block_starts.append(i)
+        block_ends = [*block_starts[1:], len(offsets)]
+
+        with open(reads_file_path, 'rb') as f:
+            for first, last in zip(block_starts, block_ends):
+                block_offset = int(offsets[first])
+                f.seek(block_offset)
+                block = f.read(int(ends[last - 1]) - block_offset)
+                for i in range(first, last):
+                    record = block[offsets[i] - block_offset:ends[i] - block_offset]
+                    header, read_seq, plus, quality = record.split(b'\n')[:4]
+                    assert header[:1] == b'@'
+                    assert plus[:1] == b'+'
+                    yield header[1:37], read_seq, quality
+
+
+if __name__ == '__main__':
+    import os
+
+
+    print()
+
+
+    reads_file_path = 'all_reads_cy1_nb_6wpi_leaf.fastq'
+    print(f'{reads_file_path=}')
+    print()
+
+
+    index_file_path = reads_file_path + '.fqi'
+    print(f'{index_file_path=}')
+    print()
+
+
+    if not os.path.exists(index_file_path):
+        FastqIndex.build(reads_file_path, index_file_path)
+        print('Successfully built FASTQ index!')
+        print()
+
+    fastq_index = FastqIndex(index_file_path)
+    print(f'{len(fastq_index)=}')
+    print()
+
+
+    # one read ID per line
+    read_ids_file_path = 'chimeric_read_ids_cy1_nb_6wpi_leaf.txt'
+    print(f'{read_ids_file_path=}')
+    print()
+
+    with open(read_ids_file_path, 'r') as f:
+        read_ids = [line.strip() for line in f if line.strip() != '']
+    print(f'{len(read_ids)=}')
+    print()
+
+
+    fetched_reads_file_path = os.path.splitext(read_ids_file_path)[0] + '.fastq'
+    print(f'{fetched_reads_file_path=}')
+    print()
+
+    num_fetched_reads = 0
+
+    with open(fetched_reads_file_path, 'wb', buffering=1 << 20) as f:
+        for read_id, read_seq, quality in fastq_index.fetch(reads_file_path, read_ids):
+            f.write(b'@' + read_id + b'\n' + read_seq + b'\n+\n' + quality + b'\n')
+            num_fetched_reads += 1
+
+    print(f'{num_fetched_reads=}')
+    print()
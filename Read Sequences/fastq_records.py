@@ -0,0 +1,84 @@
+import collections
+
+
+class FastqChunks:
+    @staticmethod
+    def in_(file_path, chunk_size=1 << 24, with_spans=False):
+        """Yields lists of the (read ID, read sequence, quality) records in the FASTQ file.
+
+        Records are read in chunks of about chunk-size bytes and are given as bytes.
+        All read sequences in a chunk are checked to only contain A, U, G and C at once.
+
+        If with-spans is True, records also have the byte offset and byte length of the record
+        in the file (covering all four lines, including the newline at the end of the quality line).
+        """
+        with open(file_path, 'rb') as f:
+            leftover = b''
+            # the offset of the start of the next record
+            offset = 0
+            while True:
+                chunk = f.read(chunk_size)
+                data = leftover + chunk
+                lines = data.split(b'\n')
+                if chunk:
+                    # the last line might be incomplete
+                    num_complete_lines = len(lines) - 1
+                else:
+                    # no trailing newline at the end of the file
+                    if lines[-1] == b'':
+                        lines.pop()
+                    num_complete_lines = len(lines)
+                    assert num_complete_lines % 4 == 0
+                num_record_lines = num_complete_lines - (num_complete_lines % 4)
+                leftover = b'\n'.join(lines[num_record_lines:])
+
+                records = []
+                for i in range(0, num_record_lines, 4):
+                    assert lines[i][:1] == b'@'
+                    read_id = lines[i][1:37]
+                    assert len(read_id) == 36
+                    read_seq = lines[i + 1]
+                    assert len(read_seq) > 0
+                    assert lines[i + 2][:1] == b'+'
+                    quality = lines[i + 3]
+                    assert len(quality) == len(read_seq)
+                    if with_spans:
+                        record_length = len(lines[i]) + len(read_seq) + len(lines[i + 2]) + len(quality) + 4
+                        records.append((read_id, read_seq, quality, offset, record_length))
+                        offset += record_length
+                    else:
+                        records.append((read_id, read_seq, quality))
+
+                # all remaining characters are something other than A, U, G or C
+                assert len(b''.join([record[1] for record in records]).translate(None, b'AUGC')) == 0
+
+                if records:
+                    yield records
+
+                if not chunk:
+                    assert leftover == b''
+                    break
+
+
+class FastqRecords:
+    @staticmethod
+    def in_(file_path):
+        """Yields the (read ID, read sequence, quality) records in the FASTQ file one at a time."""
+        for records in FastqChunks.in_(file_path):
+            yield from records
+
+
+def map_chunks(executor, function, reads_file_path, chunk_size=1 << 22, max_pending=8):
+    """Yields the results of applying the function to each chunk of records in the FASTQ file.
+
+    Chunks are submitted to the executor (e.g., a process pool) as they are read
+    and results are yielded in the order of the chunks.
+    At most max-pending chunks are held in memory at once.
+    """
+    pending = collections.deque()
+    for records in FastqChunks.in_(reads_file_path, chunk_size=chunk_size):
+        pending.append(executor.submit(function, records))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while len(pending) > 0:
+        yield pending.popleft().result()
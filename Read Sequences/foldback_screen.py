@@ -0,0 +1,229 @@
+import concurrent.futures
+
+import json
+
+import os
+
+import numpy as np
+
+from fastq_records import map_chunks
+
+from kmers import Codes, ReverseComplementCodes, KmerCodes
+
+
+class Fold:
+    @staticmethod
+    def of(codes, k=11, tolerance=10, max_occurrences=4, min_loop_length=0):
+        """Finds the fold of a read whose second half is the reverse complement of its first half.
+
+        K-mers of the read are matched to k-mers of its reverse complement,
+        which pairs read k-mer i with read k-mer j (i < j) wherever they are reverse complements.
+        Each pair implies a fold position of (i + j + k) / 2
+        and the fold is placed where the most pairs agree (within the tolerance, to allow for indels).
+
+        Returns the fold position (0-based, between bases), the arm length (of the shorter arm),
+        the number of supporting k-mers and the arm identity
+        (the fraction of k-mers of the shorter arm that have a partner on the other arm).
+        Returns None for reads without any pairs.
+        """
+        read_length = len(codes)
+        kmer_codes, is_valid = KmerCodes.of(codes, k)
+        if len(kmer_codes) == 0:
+            return None
+        reverse_complement_kmer_codes, is_reverse_complement_valid = KmerCodes.of(ReverseComplementCodes.of(codes), k)
+
+        # the k-mer of the reverse complement at position p is the reverse complement of read k-mer L - k - p
+        partner_positions = read_length - k - np.flatnonzero(is_reverse_complement_valid)
+        partner_kmer_codes = reverse_complement_kmer_codes[is_reverse_complement_valid]
+        order = np.argsort(partner_kmer_codes, kind='stable')
+        partner_kmer_codes = partner_kmer_codes[order]
+        partner_positions = partner_positions[order]
+
+        positions = np.flatnonzero(is_valid)
+        kmer_codes = kmer_codes[is_valid]
+        firsts = np.searchsorted(partner_kmer_codes, kmer_codes, side='left')
+        lasts = np.searchsorted(partner_kmer_codes, kmer_codes, side='right')
+        counts = lasts - firsts
+        # skips low-complexity k-mers
+        counts[counts > max_occurrences] = 0
+        num_pairs = int(counts.sum())
+        if num_pairs == 0:
+            return None
+        offsets = np.arange(num_pairs) - np.repeat(np.cumsum(counts) - counts, counts)
+        i = np.repeat(positions, counts)
+        j = partner_positions[np.repeat(firsts, counts) + offsets]
+
+        # each pair once and with arms that do not overlap
+        is_pair = j >= i + k + min_loop_length
+        i = i[is_pair]
+        j = j[is_pair]
+        if len(i) == 0:
+            return None
+
+        # twice the fold position
+        double_folds = i + j + k
+        pair_counts = np.bincount(double_folds, minlength=2 * read_length + 1)
+        window_counts = np.convolve(pair_counts, np.ones(4 * tolerance + 1, dtype=np.int64), mode='same')
+        # window counts are flat around a peak (so the argmax is the first center that covers it)
+        # and the argmax only picks the window, with the fold at the median of the pairs in it
+        window_center = int(np.argmax(window_counts))
+        double_fold = int(np.median(double_folds[np.abs(double_folds - window_center) <= 2 * tolerance]))
+        fold = double_fold / 2
+
+        is_supporting = np.abs(double_folds - double_fold) <= 2 * tolerance
+        num_supporting_kmers = len(np.unique(i[is_supporting]))
+        arm_length = min(fold, read_length - fold)
+        arm_identity = min(num_supporting_kmers / max(arm_length - k + 1, 1), 1.0)
+
+        return fold, arm_length, num_supporting_kmers, arm_identity
+
+
+# set in each worker process by init_worker
+worker_state = {}
+
+
+def init_worker(k, min_supporting_kmers, min_arm_identity):
+    worker_state['k'] = k
+    worker_state['min_supporting_kmers'] = min_supporting_kmers
+    worker_state['min_arm_identity'] = min_arm_identity
+
+
+def screen_chunk(records):
+    """Returns the (read ID, read length, fold, arm length, supporting k-mers, arm identity, is foldback)
+    of each read in the chunk.
+    """
+    results = []
+    for read_id, read_seq, quality in records:
+        fold = Fold.of(Codes.of(read_seq), k=worker_state['k'])
+        if fold is None:
+            results.append((read_id.decode(), len(read_seq), np.nan, 0.0, 0, 0.0, False))
+            continue
+        fold_position, arm_length, num_supporting_kmers, arm_identity = fold
+        is_foldback = num_supporting_kmers >= worker_state['min_supporting_kmers'] \
+            and arm_identity >= worker_state['min_arm_identity']
+        results.append((read_id.decode(), len(read_seq), fold_position, arm_length, num_supporting_kmers, arm_identity, is_foldback))
+    return results
+
+
+def screen_reads(reads_file_path, screen_file_path, k=11, min_supporting_kmers=10, min_arm_identity=0.1, max_workers=None):
+    """Screens all reads in the FASTQ file for foldbacks in a process pool.
+
+    Results are written to a tab-separated file (fold positions are 0-based and between bases).
+
+    Returns the number of reads screened and the number of foldbacks found.
+    """
+    num_reads = 0
+    num_foldbacks = 0
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=init_worker,
+        initargs=(k, min_supporting_kmers, min_arm_identity),
+    ) as executor:
+        with open(screen_file_path, 'w', buffering=1 << 20) as f:
+            f.write('read_id\tread_length\tfold_position\tfold_fraction\tarm_length\tnum_supporting_kmers\tarm_identity\tis_foldback\n')
+            for results in map_chunks(
+                executor,
+                screen_chunk,
+                reads_file_path,
+                chunk_size=1 << 20,
+                max_pending=2 * (max_workers or os.cpu_count() or 1),
+            ):
+                for read_id, read_length, fold_position, arm_length, num_supporting_kmers, arm_identity, is_foldback in results:
+                    f.write(
+                        f'{read_id}\t{read_length}\t{fold_position}\t{fold_position / read_length:.4f}\t{arm_length}'
+                        f'\t{num_supporting_kmers}\t{arm_identity:.4f}\t{int(is_foldback)}\n'
+                    )
+                    num_reads += 1
+                    num_foldbacks += is_foldback
+
+    return num_reads, num_foldbacks
+
+
+class ScreenedFoldbacks:
+    @staticmethod
+    def in_(screen_file_path):
+        """Returns a dictionary of whether each read is a foldback (keyed by read ID)."""
+        with open(screen_file_path, 'r') as f:
+            header = f.readline().rstrip('\n').split('\t')
+            is_foldback_column = header.index('is_foldback')
+            return {
+                fields[0]: fields[is_foldback_column] == '1'
+                for fields in (line.rstrip('\n').split('\t') for line in f)
+            }
+
+
+def is_blast_foldback(search):
+    """Returns True if the BLAST search is for a foldback read.
+
+    (I.e., a two-segment plus-minus hybrid read or a type II minus-strand read.)
+    """
+    hits = search['hits']
+    if len(hits) != 1:
+        return False
+    hsps = hits[0]['hsps']
+    hit_strands = set(hsp['hit_strand'] for hsp in hsps)
+    if hit_strands == {'Plus', 'Minus'}:
+        return len(hsps) == 2
+    elif hit_strands == {'Minus'}:
+        min_query_from = min(hsp['query_from'] for hsp in hsps)
+        return 0.4 <= min_query_from / search['query_len'] <= 0.53
+    else:
+        return False
+
+
+if __name__ == '__main__':
+    print()
+
+
+    reads_file_path = 'all_reads_cy1_nb_6wpi_leaf.fastq'
+    print(f'{reads_file_path=}')
+    print()
+
+
+    screen_file_path = 'foldback_screen_' + reads_file_path.removeprefix('all_reads_').removesuffix('.fastq') + '.tsv'
+    print(f'{screen_file_path=}')
+    print()
+
+    num_reads, num_foldbacks = screen_reads(reads_file_path, screen_file_path)
+    print(f'{num_reads=}')
+    print(f'{num_foldbacks=}')
+    print()
+
+
+    # cross-checks against the foldback calls from BLAST hsps
+    blast_output_file_path = 'blast_output_cy1_nb_6wpi_leaf.json'
+    print(f'{blast_output_file_path=}')
+    print()
+
+    with open(blast_output_file_path, 'r') as f:
+        blast_output = json.loads(f.read())
+    print('Successfully parsed BLAST output.')
+    print()
+
+    screened_foldbacks = ScreenedFoldbacks.in_(screen_file_path)
+
+    num_both = 0
+    num_only_screened = 0
+    num_only_blast = 0
+    num_neither = 0
+
+    for item in blast_output['BlastOutput2']:
+        search = item['report']['results']['search']
+        read_id = search['query_title']
+        if read_id not in screened_foldbacks:
+            continue
+        if screened_foldbacks[read_id] and is_blast_foldback(search):
+            num_both += 1
+        elif screened_foldbacks[read_id]:
+            num_only_screened += 1
+        elif is_blast_foldback(search):
+            num_only_blast += 1
+        else:
+            num_neither += 1
+
+    print(f'{num_both=}')
+    print(f'{num_only_screened=}')
+    print(f'{num_only_blast=}')
+    print(f'{num_neither=}')
+    print()
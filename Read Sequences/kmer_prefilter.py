@@ -0,0 +1,161 @@
+import concurrent.futures
+
+import os
+
+import numpy as np
+
+from fastq_records import map_chunks
+
+from kmers import Codes, ReverseComplementCodes, KmerCodes, ConcatenatedKmerCodes, KmerSet, FastaSeqs
+
+
+class ReferenceKmerSets:
+    @staticmethod
+    def for_(reference_file_path, k):
+        """Returns the sets of k-mers of the plus and minus strands of the sequences in the FASTA file.
+
+        (Plus-strand reads share k-mers with the plus set and minus-strand reads with the minus set.)
+        """
+        plus_kmer_codes = []
+        minus_kmer_codes = []
+        for name, seq in FastaSeqs.in_(reference_file_path):
+            codes = Codes.of(seq)
+            kmer_codes, is_valid = KmerCodes.of(codes, k)
+            plus_kmer_codes.append(kmer_codes[is_valid])
+            kmer_codes, is_valid = KmerCodes.of(ReverseComplementCodes.of(codes), k)
+            minus_kmer_codes.append(kmer_codes[is_valid])
+        return KmerSet(np.concatenate(plus_kmer_codes)), KmerSet(np.concatenate(minus_kmer_codes))
+
+
+# set in each worker process by init_worker
+worker_state = {}
+
+
+def init_worker(reference_file_path, k, min_shared_kmers):
+    plus_kmer_set, minus_kmer_set = ReferenceKmerSets.for_(reference_file_path, k)
+    worker_state['k'] = k
+    worker_state['min_shared_kmers'] = min_shared_kmers
+    worker_state['plus_kmer_set'] = plus_kmer_set
+    worker_state['minus_kmer_set'] = minus_kmer_set
+
+
+class StrandEvidence:
+    @staticmethod
+    def of(num_plus_kmers, num_minus_kmers):
+        """Returns plus or minus if one strand has at least four times as many shared k-mers and mixed otherwise."""
+        if num_plus_kmers >= 4 * num_minus_kmers:
+            return 'plus'
+        elif num_minus_kmers >= 4 * num_plus_kmers:
+            return 'minus'
+        else:
+            return 'mixed'
+
+
+def prefilter_chunk(records):
+    """Returns the number of records in the chunk and the records that share enough k-mers with the reference.
+
+    Each returned record also holds the numbers of k-mers shared with the plus and minus strands.
+    """
+    k = worker_state['k']
+    kmer_codes, read_indices, positions = ConcatenatedKmerCodes.of(
+        [read_seq for read_id, read_seq, quality in records],
+        k,
+    )
+    num_plus_kmers = np.bincount(
+        read_indices[worker_state['plus_kmer_set'].contains(kmer_codes)],
+        minlength=len(records),
+    )
+    num_minus_kmers = np.bincount(
+        read_indices[worker_state['minus_kmer_set'].contains(kmer_codes)],
+        minlength=len(records),
+    )
+    is_selected = num_plus_kmers + num_minus_kmers >= worker_state['min_shared_kmers']
+    return len(records), [
+        (*records[i], int(num_plus_kmers[i]), int(num_minus_kmers[i]))
+        for i in np.flatnonzero(is_selected)
+    ]
+
+
+def prefilter_reads(reads_file_path, reference_file_path, selected_reads_file_path, strand_evidence_file_path, k=15, min_shared_kmers=5, max_workers=None):
+    """Writes the reads sharing at least min-shared-kmers k-mers (on either strand) with the reference.
+
+    Selected reads are written to a FASTQ file
+    and their shared k-mer counts and strand evidence to a tab-separated file.
+    Chunks of reads are scanned in a process pool.
+
+    Returns the numbers of reads scanned and selected.
+    """
+    num_reads = 0
+    num_selected_reads = 0
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=init_worker,
+        initargs=(reference_file_path, k, min_shared_kmers),
+    ) as executor:
+        with open(selected_reads_file_path, 'wb', buffering=1 << 22) as selected_reads_file, \
+                open(strand_evidence_file_path, 'w', buffering=1 << 20) as strand_evidence_file:
+            strand_evidence_file.write('read_id\tread_length\tnum_plus_kmers\tnum_minus_kmers\tstrand_evidence\n')
+
+            for num_chunk_reads, selected_records in map_chunks(
+                executor,
+                prefilter_chunk,
+                reads_file_path,
+                max_pending=2 * (max_workers or os.cpu_count() or 1),
+            ):
+                num_reads += num_chunk_reads
+                num_selected_reads += len(selected_records)
+                for read_id, read_seq, quality, num_plus_kmers, num_minus_kmers in selected_records:
+                    selected_reads_file.write(b'@' + read_id + b'\n' + read_seq + b'\n+\n' + quality + b'\n')
+                    strand_evidence_file.write(
+                        f'{read_id.decode()}\t{len(read_seq)}\t{num_plus_kmers}\t{num_minus_kmers}'
+                        f'\t{StrandEvidence.of(num_plus_kmers, num_minus_kmers)}\n'
+                    )
+
+    return num_reads, num_selected_reads
+
+
+if __name__ == '__main__':
+    print()
+
+
+    reads_file_path = 'all_reads_cy1_nb_6wpi_leaf.fastq'
+    print(f'{reads_file_path=}')
+    print()
+
+    # CY1 and CY2
+    reference_file_path = 'cy1_cy2.fasta'
+    print(f'{reference_file_path=}')
+    print()
+
+
+    k = 15
+    min_shared_kmers = 5
+    print(f'{k=}')
+    print(f'{min_shared_kmers=}')
+    print()
+
+
+    sample_name = reads_file_path.removeprefix('all_reads_').removesuffix('.fastq')
+
+    selected_reads_file_path = f'prefiltered_reads_{sample_name}.fastq'
+    print(f'{selected_reads_file_path=}')
+    print()
+
+    strand_evidence_file_path = f'prefilter_strand_evidence_{sample_name}.tsv'
+    print(f'{strand_evidence_file_path=}')
+    print()
+
+
+    num_reads, num_selected_reads = prefilter_reads(
+        reads_file_path,
+        reference_file_path,
+        selected_reads_file_path,
+        strand_evidence_file_path,
+        k=k,
+        min_shared_kmers=min_shared_kmers,
+    )
+    print(f'{num_reads=}')
+    print(f'{num_selected_reads=}')
+    print(f'{100 * num_selected_reads / num_reads=}')
+    print()
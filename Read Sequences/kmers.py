@@ -0,0 +1,100 @@
+import numpy as np
+
+from pack_reads import encoding_table
+
+
+class Codes:
+    @staticmethod
+    def of(seq):
+        """Returns the 2-bit codes of the sequence (given as bytes or a str).
+
+        T is treated as U and lowercase bases as uppercase.
+        Any other characters (e.g., N) are given as 255.
+        """
+        if isinstance(seq, str):
+            seq = seq.encode('ascii')
+        seq = seq.upper().replace(b'T', b'U')
+        return encoding_table[np.frombuffer(seq, dtype=np.uint8)]
+
+
+class ReverseComplementCodes:
+    @staticmethod
+    def of(codes):
+        """Returns the 2-bit codes of the reverse complement of the codes.
+
+        (With A = 0, C = 1, G = 2 and U = 3, the complement of a code is 3 minus the code.)
+        """
+        codes = codes[::-1]
+        return np.where(codes == 255, 255, 3 - codes).astype(np.uint8)
+
+
+class KmerCodes:
+    @staticmethod
+    def of(codes, k):
+        """Returns the k-mer codes at each position of the 2-bit codes and whether each k-mer is valid.
+
+        K-mer codes pack the 2-bit codes of a k-mer into a single integer (first base in the high bits).
+        K-mers covering any code of 255 are not valid.
+        """
+        assert 1 <= k <= 31
+        if len(codes) < k:
+            return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool)
+        num_kmers = len(codes) - k + 1
+        # k passes over the codes (rather than a k-wide window array) keeps memory linear
+        kmer_codes = np.zeros(num_kmers, dtype=np.uint64)
+        for j in range(k):
+            kmer_codes = (kmer_codes << np.uint64(2)) | (codes[j:j + num_kmers] & 3).astype(np.uint64)
+        num_invalid = np.concatenate([[0], np.cumsum(codes == 255)])
+        is_valid = num_invalid[k:] == num_invalid[:num_kmers]
+        return kmer_codes, is_valid
+
+
+class ConcatenatedKmerCodes:
+    @staticmethod
+    def of(seqs, k):
+        """Returns the k-mer codes of all of the sequences at once.
+
+        Also returns the index of the sequence and the position in the sequence of each k-mer.
+        K-mers that are not valid (or that would span two sequences) are left out.
+        """
+        seq_lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+        codes = Codes.of(b''.join(seqs))
+        kmer_codes, is_valid = KmerCodes.of(codes, k)
+        seq_indices = np.repeat(np.arange(len(seqs)), seq_lengths)[:len(kmer_codes)]
+        seq_starts = np.concatenate([[0], np.cumsum(seq_lengths)[:-1]])
+        positions = np.arange(len(kmer_codes)) - seq_starts[seq_indices]
+        is_valid &= positions + k <= seq_lengths[seq_indices]
+        return kmer_codes[is_valid], seq_indices[is_valid], positions[is_valid]
+
+
+class KmerSet:
+    """A sorted array of unique k-mer codes."""
+
+    def __init__(self, kmer_codes):
+        self.kmer_codes = np.unique(kmer_codes)
+
+    def __len__(self):
+        return len(self.kmer_codes)
+
+    def contains(self, kmer_codes):
+        """Returns whether each of the k-mer codes is in the set."""
+        if len(self.kmer_codes) == 0:
+            return np.zeros(len(kmer_codes), dtype=bool)
+        indices = np.minimum(np.searchsorted(self.kmer_codes, kmer_codes), len(self.kmer_codes) - 1)
+        return self.kmer_codes[indices] == kmer_codes
+
+
+class FastaSeqs:
+    @staticmethod
+    def in_(file_path):
+        """Returns the (name, sequence) records in the FASTA file (sequences as bytes)."""
+        seqs = []
+        with open(file_path, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith(b'>'):
+                    seqs.append((line[1:].split()[0].decode(), []))
+                elif len(line) > 0:
+                    assert len(seqs) > 0
+                    seqs[-1][1].append(line)
+        return [(name, b''.join(lines)) for name, lines in seqs]
@@ -0,0 +1,186 @@
+import os
+
+import uuid
+
+import numpy as np
+
+from fastq_records import FastqChunks
+
+
+# the 2-bit code of each base
+base_codes = {'A': 0, 'C': 1, 'G': 2, 'U': 3}
+
+bases = np.frombuffer(b'ACGU', dtype=np.uint8)
+
+
+def _encoding_table():
+    table = np.full(256, 255, dtype=np.uint8)
+    for base, code in base_codes.items():
+        table[ord(base)] = code
+    return table
+
+
+# maps ASCII characters to 2-bit codes
+encoding_table = _encoding_table()
+
+# maps each packed byte to the four 2-bit codes that it holds (first base in the high bits)
+unpacking_table = np.stack(
+    [(np.arange(256) >> shift) & 3 for shift in (6, 4, 2, 0)],
+    axis=1,
+).astype(np.uint8)
+
+
+class Packed:
+    @staticmethod
+    def of(codes):
+        """Packs 2-bit codes four per byte.
+
+        The number of codes must be a multiple of four.
+        """
+        assert len(codes) % 4 == 0
+        return (codes[0::4] << 6) | (codes[1::4] << 4) | (codes[2::4] << 2) | codes[3::4]
+
+
+class ReadIDBytes:
+    @staticmethod
+    def of(read_id):
+        """Returns the 16 bytes of the UUID read ID (given as a str or as bytes)."""
+        if isinstance(read_id, bytes):
+            read_id = read_id.decode('ascii')
+        return uuid.UUID(read_id).bytes
+
+
+def pack_reads(reads_file_path, packed_reads_dir_path):
+    """Packs the read sequences in the FASTQ file into a 2-bit packed read store.
+
+    The store is a directory with:
+        seqs.bin (the packed sequences of all reads, one after the other),
+        offsets.npy (the base offset of each read in seqs.bin, plus the total number of bases),
+        ids.npy (the 16-byte read IDs in sorted order),
+        id_order.npy (the index of the read for each sorted read ID).
+
+    Reads are streamed from the FASTQ file, so only the offsets and read IDs are held in memory.
+    """
+    os.makedirs(packed_reads_dir_path, exist_ok=True)
+
+    offsets = [0]
+    read_ids = []
+
+    # codes that did not fill up a whole byte yet
+    leftover_codes = np.zeros(0, dtype=np.uint8)
+
+    with open(os.path.join(packed_reads_dir_path, 'seqs.bin'), 'wb') as f:
+        for records in FastqChunks.in_(reads_file_path):
+            for read_id, read_seq, quality in records:
+                read_ids.append(ReadIDBytes.of(read_id))
+                offsets.append(offsets[-1] + len(read_seq))
+
+            codes = encoding_table[np.frombuffer(b''.join([read_seq for read_id, read_seq, quality in records]), dtype=np.uint8)]
+            assert np.all(codes != 255)
+
+            codes = np.concatenate([leftover_codes, codes])
+            num_packable_codes = len(codes) - (len(codes) % 4)
+            f.write(Packed.of(codes[:num_packable_codes]).tobytes())
+            leftover_codes = codes[num_packable_codes:]
+
+        # pads the last byte
+        if len(leftover_codes) > 0:
+            padding = np.zeros(4 - len(leftover_codes), dtype=np.uint8)
+            f.write(Packed.of(np.concatenate([leftover_codes, padding])).tobytes())
+
+    ids = np.array(read_ids, dtype='S16')
+    id_order = np.argsort(ids, kind='stable')
+    assert np.all(ids[id_order][1:] != ids[id_order][:-1]), 'Read IDs must be unique.'
+
+    np.save(os.path.join(packed_reads_dir_path, 'offsets.npy'), np.array(offsets, dtype=np.int64))
+    np.save(os.path.join(packed_reads_dir_path, 'ids.npy'), ids[id_order])
+    np.save(os.path.join(packed_reads_dir_path, 'id_order.npy'), id_order)
+
+
+class PackedReads:
+    """A memory-mapped 2-bit packed read store (as written by pack_reads)."""
+
+    def __init__(self, packed_reads_dir_path):
+        self.packed_seqs = np.memmap(
+            os.path.join(packed_reads_dir_path, 'seqs.bin'),
+            dtype=np.uint8,
+            mode='r',
+        )
+        self.offsets = np.load(os.path.join(packed_reads_dir_path, 'offsets.npy'), mmap_mode='r')
+        self.ids = np.load(os.path.join(packed_reads_dir_path, 'ids.npy'), mmap_mode='r')
+        self.id_order = np.load(os.path.join(packed_reads_dir_path, 'id_order.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def read_lengths(self):
+        """The length of each read (in the order of the FASTQ file)."""
+        return np.diff(self.offsets)
+
+    def indices_of(self, read_ids):
+        """Returns the indices of the reads with the given IDs.
+
+        Raises if any of the read IDs is not in the store.
+        """
+        ids = np.array([ReadIDBytes.of(read_id) for read_id in read_ids], dtype='S16')
+        positions = np.searchsorted(self.ids, ids)
+        assert np.all(positions < len(self.ids))
+        assert np.all(self.ids[positions] == ids), 'Read ID not found.'
+        return np.asarray(self.id_order[positions])
+
+    def index_of(self, read_id):
+        """Returns the index of the read with the given ID."""
+        return int(self.indices_of([read_id])[0])
+
+    def codes(self, index, start=0, end=None):
+        """Returns the 2-bit codes of the read with the given index.
+
+        Start and end are 0-based, half-open positions in the read
+        and can be used to only unpack a part of the read.
+        """
+        read_start = int(self.offsets[index])
+        read_length = int(self.offsets[index + 1]) - read_start
+        end = read_length if end is None else end
+        assert 0 <= start <= end <= read_length
+        first = read_start + start
+        last = read_start + end
+        packed = self.packed_seqs[first // 4:(last + 3) // 4]
+        return unpacking_table[packed].ravel()[first % 4:first % 4 + (last - first)]
+
+    def seq(self, read_id, start=0, end=None):
+        """Returns the sequence (as a str) of the read with the given ID."""
+        codes = self.codes(self.index_of(read_id), start=start, end=end)
+        return bases[codes].tobytes().decode('ascii')
+
+
+if __name__ == '__main__':
+    print()
+
+
+    reads_file_path = 'all_reads_cy1_nb_6wpi_leaf.fastq'
+
+    #reads_file_path = 'all_reads_ivt_cy1_gRNA.fastq'
+    #reads_file_path = 'all_reads_cy1_nb_2wpi_leaf.fastq'
+    #reads_file_path = 'all_reads_cy1_nb_2wpi_root.fastq'
+    #reads_file_path = 'all_reads_cy1_nb_6wpi_root.fastq'
+
+    print(f'{reads_file_path=}')
+    print()
+
+
+    packed_reads_dir_path = 'packed_' + os.path.splitext(reads_file_path)[0]
+    print(f'{packed_reads_dir_path=}')
+    print()
+
+
+    pack_reads(reads_file_path, packed_reads_dir_path)
+    print('Successfully packed reads!')
+    print()
+
+
+    packed_reads = PackedReads(packed_reads_dir_path)
+    print(f'{len(packed_reads)=}')
+    print(f'{int(packed_reads.read_lengths.sum())=}')
+    print(f'{len(packed_reads.packed_seqs)=}')
+    print()
@@ -0,0 +1,171 @@
+import json
+
+import numpy as np
+
+from pack_reads import base_codes, PackedReads
+
+
+class Searches:
+    @staticmethod
+    def in_(blast_output):
+        """Returns all searches in the BLAST output."""
+        return [item['report']['results']['search'] for item in blast_output['BlastOutput2']]
+
+
+class MaxQueryPosition:
+    @staticmethod
+    def for_(search):
+        """Returns the maximum query position of the hsps for the single hit of the search.
+
+        Raises if the search does not have exactly one hit.
+        """
+        hits = search['hits']
+        assert len(hits) == 1
+        return max(max(hsp['query_from'], hsp['query_to']) for hsp in hits[0]['hsps'])
+
+
+class OverhangCodes:
+    @staticmethod
+    def in_(packed_reads, read_indices, overhang_starts, overhang_ends, max_length):
+        """Returns the 2-bit codes of the 3' overhangs of the reads as a (reads x max-length) array.
+
+        Overhang starts and ends are 0-based, half-open read positions.
+        Codes are gathered straight from the packed sequences for all reads at once.
+        Positions past the end of an overhang are given as 255.
+        """
+        read_starts = np.asarray(packed_reads.offsets)[read_indices]
+        positions = (read_starts + overhang_starts)[:, None] + np.arange(max_length)[None, :]
+        is_in_overhang = positions < (read_starts + overhang_ends)[:, None]
+        positions = np.where(is_in_overhang, positions, 0)
+        packed = np.asarray(packed_reads.packed_seqs[positions // 4])
+        codes = (packed >> (6 - 2 * (positions % 4)).astype(np.uint8)) & 3
+        return np.where(is_in_overhang, codes, 255).astype(np.uint8)
+
+
+class PolyALengths:
+    @staticmethod
+    def of(codes, max_mismatches=2, min_num_as=10):
+        """Returns the length of the terminal poly(A) run at the end of each row of codes.
+
+        Rows are read 5' to 3' and end with the read (undefined positions are only at the end of a row).
+        The run is measured back from the read's 3' end, so it does not depend on where the alignment stops:
+        it extends back from the last defined position until just after the (max-mismatches + 1)th
+        non-A base from the end (or the start of the row) and is then trimmed to run from its first A to its last A.
+        Runs with fewer than min-num-As As (e.g., the odd A near the end of an untailed read) have a length of 0.
+        """
+        is_defined = codes != 255
+        is_a = is_defined & (codes == base_codes['A'])
+        # the number of non-A bases at or after each position
+        num_mismatches_from_end = np.cumsum((is_defined & ~is_a)[:, ::-1], axis=1)[:, ::-1]
+        is_run_a = is_a & (num_mismatches_from_end <= max_mismatches)
+        positions = np.arange(codes.shape[1])[None, :]
+        has_run = np.sum(is_run_a, axis=1) >= min_num_as
+        first_as = np.min(np.where(is_run_a, positions, codes.shape[1]), axis=1)
+        last_as = np.max(np.where(is_run_a, positions, -1), axis=1)
+        return np.where(has_run, last_as - first_as + 1, 0)
+
+
+def poly_a_tails(blast_output_file_path, packed_reads_dir_path, max_length=500, max_mismatches=2, min_num_as=10, batch_size=10000):
+    """Measures the terminal poly(A) run in the 3' overhang of each read with a hit.
+
+    The 3' overhang of a read is the part of the read after its largest aligned query position
+    and only its last max-length bases are searched (back from the read's 3' end).
+
+    Returns the read IDs, 3' overhang lengths and poly(A) lengths as arrays.
+    """
+    with open(blast_output_file_path, 'r') as f:
+        blast_output = json.loads(f.read())
+
+    searches_with_a_hit = [search for search in Searches.in_(blast_output) if len(search['hits']) > 0]
+
+    packed_reads = PackedReads(packed_reads_dir_path)
+
+    read_ids = [search['query_title'] for search in searches_with_a_hit]
+    read_lengths = np.array([search['query_len'] for search in searches_with_a_hit], dtype=np.int64)
+    overhang_starts = np.array([MaxQueryPosition.for_(search) for search in searches_with_a_hit], dtype=np.int64)
+
+    read_indices = packed_reads.indices_of(read_ids)
+    assert np.all(packed_reads.read_lengths[read_indices] == read_lengths)
+
+    poly_a_lengths = np.zeros(len(read_ids), dtype=np.int64)
+
+    # bounds the size of the code arrays
+    for first in range(0, len(read_ids), batch_size):
+        last = min(first + batch_size, len(read_ids))
+        codes = OverhangCodes.in_(
+            packed_reads,
+            read_indices[first:last],
+            np.maximum(overhang_starts[first:last], read_lengths[first:last] - max_length),
+            read_lengths[first:last],
+            max_length,
+        )
+        poly_a_lengths[first:last] = PolyALengths.of(codes, max_mismatches=max_mismatches, min_num_as=min_num_as)
+
+    return np.array(read_ids, dtype='S36'), read_lengths - overhang_starts, poly_a_lengths
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+
+    print()
+
+
+    # (class, BLAST output file path, packed reads directory path)
+    read_sets = [
+        ('CY1', 'blast_output_cy1_nb_6wpi_leaf.json', 'packed_all_reads_cy1_nb_6wpi_leaf'),
+        ('CY2', 'blast_output_cy2_nb_14wpi_leaf.json', 'packed_all_reads_cy2_nb_14wpi_leaf'),
+        ('host', 'blast_to_rubisco_large_output_cy1_nb_2wpi_leaf.json', 'packed_all_reads_cy1_nb_2wpi_leaf'),
+    ]
+
+    print(f'{len(read_sets)=}')
+    print()
+
+
+    max_length = 500
+    max_mismatches = 2
+    min_num_as = 10
+    print(f'{max_length=}')
+    print(f'{max_mismatches=}')
+    print(f'{min_num_as=}')
+    print()
+
+
+    poly_a = {}
+
+    for read_class, blast_output_file_path, packed_reads_dir_path in read_sets:
+        read_ids, overhang_lengths, poly_a_lengths = poly_a_tails(
+            blast_output_file_path,
+            packed_reads_dir_path,
+            max_length=max_length,
+            max_mismatches=max_mismatches,
+            min_num_as=min_num_as,
+        )
+        poly_a[f'{read_class}_read_ids'] = read_ids
+        poly_a[f'{read_class}_overhang_lengths'] = overhang_lengths
+        poly_a[f'{read_class}_poly_a_lengths'] = poly_a_lengths
+        print(f'{read_class}: {len(read_ids)} reads, median poly(A) length = {np.median(poly_a_lengths)}, median 3\' overhang length = {np.median(overhang_lengths)}')
+    print()
+
+
+    poly_a_file_path = 'poly_a_tails.npz'
+    print(f'{poly_a_file_path=}')
+    print()
+
+    np.savez_compressed(poly_a_file_path, **poly_a)
+    print('Saved poly(A) tails.')
+    print()
+
+
+    fig, ax = plt.subplots()
+
+    plt.hist(
+        poly_a['CY1_poly_a_lengths'],
+        #poly_a['CY2_poly_a_lengths'],
+        #poly_a['host_poly_a_lengths'],
+        #poly_a['CY1_overhang_lengths'] - poly_a['CY1_poly_a_lengths'],
+        color='black',
+        bins=150,
+    )
+
+    plt.show()
@@ -0,0 +1,111 @@
+import json
+
+
+class Searches:
+    @staticmethod
+    def in_(blast_output):
+        """Returns all searches in the BLAST output."""
+        return [item['report']['results']['search'] for item in blast_output['BlastOutput2']]
+
+
+class ReadID:
+    @staticmethod
+    def for_(search):
+        """Returns the ID of the read for the search."""
+        read_id = search['query_title']
+        assert type(read_id) == str
+        # all read IDs should be UUIDs
+        assert len(read_id) == 36
+        return read_id
+
+
+class Species:
+    @staticmethod
+    def of(hit):
+        """Returns the species of the hit (CY1, CY2 or host)."""
+        title = hit['description'][0]['title'].upper()
+        return title if title in ['CY1', 'CY2'] else 'host'
+
+
+class StrandClass:
+    @staticmethod
+    def of(hit):
+        """Returns the strand class (plus, minus or plus_minus_hybrid) of the hit."""
+        hit_strands = set(hsp['hit_strand'] for hsp in hit['hsps'])
+        if hit_strands == {'Plus'}:
+            return 'plus'
+        elif hit_strands == {'Minus'}:
+            return 'minus'
+        else:
+            return 'plus_minus_hybrid'
+
+
+class ReadClass:
+    @staticmethod
+    def for_(search):
+        """Returns the (species, strand class, number of hsps) of the read for the search.
+
+        Reads without a hit have species and strand class "none"
+        and reads with more than one hit have species "multiple" and strand class "none".
+        """
+        hits = search['hits']
+        if len(hits) == 0:
+            return 'none', 'none', 0
+        elif len(hits) > 1:
+            return 'multiple', 'none', 0
+        else:
+            return Species.of(hits[0]), StrandClass.of(hits[0]), len(hits[0]['hsps'])
+
+
+def write_read_classes(blast_output_file_path, read_classes_file_path):
+    """Writes the class of each read in the BLAST output to a tab-separated file.
+
+    Columns are read ID, species, strand class and number of hsps.
+    """
+    with open(blast_output_file_path, 'r') as f:
+        blast_output = json.loads(f.read())
+
+    lines = ['read_id\tspecies\tstrand_class\tnum_hsps']
+    for search in Searches.in_(blast_output):
+        species, strand_class, num_hsps = ReadClass.for_(search)
+        lines.append(f'{ReadID.for_(search)}\t{species}\t{strand_class}\t{num_hsps}')
+
+    with open(read_classes_file_path, 'w', buffering=1 << 20) as f:
+        f.write('\n'.join(lines) + '\n')
+
+    return len(lines) - 1
+
+
+class ReadClasses:
+    @staticmethod
+    def in_(read_classes_file_path):
+        """Returns a dictionary of (species, strand class, number of hsps) keyed by read ID (as bytes)."""
+        read_classes = {}
+        with open(read_classes_file_path, 'rb') as f:
+            header = f.readline().rstrip(b'\n').split(b'\t')
+            assert header == [b'read_id', b'species', b'strand_class', b'num_hsps']
+            for line in f:
+                read_id, species, strand_class, num_hsps = line.rstrip(b'\n').split(b'\t')
+                read_classes[read_id] = (species.decode(), strand_class.decode(), int(num_hsps))
+        return read_classes
+
+
+if __name__ == '__main__':
+    print()
+
+
+    blast_output_file_path = 'blast_output_cy1_nb_6wpi_leaf.json'
+    #blast_output_file_path = 'blast_output_cy2_nb_14wpi_leaf.json'
+
+    print(f'{blast_output_file_path=}')
+    print()
+
+
+    read_classes_file_path = 'read_classes_' + blast_output_file_path.removeprefix('blast_output_').removesuffix('.json') + '.tsv'
+    print(f'{read_classes_file_path=}')
+    print()
+
+
+    num_reads = write_read_classes(blast_output_file_path, read_classes_file_path)
+    print(f'{num_reads=}')
+    print()
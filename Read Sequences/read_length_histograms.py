@@ -0,0 +1,170 @@
+import concurrent.futures
+
+import numpy as np
+
+from fastq_records import FastqChunks
+
+from read_classes import ReadClasses
+
+
+class ReadLabel:
+    @staticmethod
+    def of(read_class):
+        """Returns the label used for sub-histograms of reads of the (species, strand class, number of hsps)."""
+        species, strand_class, num_hsps = read_class
+        return species if strand_class == 'none' else f'{species} {strand_class}'
+
+
+def read_length_histogram(reads_file_path, read_classes_file_path, bin_width, num_bins):
+    """Streams the FASTQ file into a histogram of read lengths.
+
+    Bins have a fixed width and the last bin also holds all longer reads.
+
+    If a read classes file is given, also returns a sub-histogram per read label
+    (reads not in the read classes file are labelled "unclassified").
+
+    Returns the histogram and a dictionary of sub-histograms keyed by read label.
+    """
+    read_classes = None if read_classes_file_path is None else ReadClasses.in_(read_classes_file_path)
+
+    histogram = np.zeros(num_bins, dtype=np.int64)
+
+    label_indices = {}
+    label_histograms = np.zeros((0, num_bins), dtype=np.int64)
+
+    for records in FastqChunks.in_(reads_file_path):
+        read_lengths = np.array([len(read_seq) for read_id, read_seq, quality in records], dtype=np.int64)
+        bins = np.minimum(read_lengths // bin_width, num_bins - 1)
+        histogram += np.bincount(bins, minlength=num_bins)
+
+        if read_classes is None:
+            continue
+
+        labels = [
+            ReadLabel.of(read_classes[read_id]) if read_id in read_classes else 'unclassified'
+            for read_id, read_seq, quality in records
+        ]
+        for label in labels:
+            if label not in label_indices:
+                label_indices[label] = len(label_indices)
+        if len(label_indices) > len(label_histograms):
+            label_histograms = np.concatenate([
+                label_histograms,
+                np.zeros((len(label_indices) - len(label_histograms), num_bins), dtype=np.int64),
+            ])
+
+        label_index_array = np.array([label_indices[label] for label in labels], dtype=np.int64)
+        label_histograms += np.bincount(
+            label_index_array * num_bins + bins,
+            minlength=len(label_indices) * num_bins,
+        ).reshape(len(label_indices), num_bins)
+
+    return histogram, {label: label_histograms[i] for label, i in label_indices.items()}
+
+
+class ReadLengthHistograms:
+    @staticmethod
+    def for_(samples, bin_width=10, num_bins=1000, max_workers=None):
+        """Computes read length histograms for all samples in a process pool.
+
+        Samples are given as (sample name, FASTQ file path, read classes file path) triples
+        (the read classes file path may be None).
+
+        Histograms of the samples (and of each read label) are merged by summing.
+        """
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                read_length_histogram,
+                [reads_file_path for name, reads_file_path, read_classes_file_path in samples],
+                [read_classes_file_path for name, reads_file_path, read_classes_file_path in samples],
+                [bin_width] * len(samples),
+                [num_bins] * len(samples),
+            ))
+
+        labels = sorted(set(label for histogram, label_histograms in results for label in label_histograms))
+
+        histograms = np.stack([histogram for histogram, label_histograms in results])
+
+        label_histograms = np.zeros((len(samples), len(labels), num_bins), dtype=np.int64)
+        for i, (histogram, sample_label_histograms) in enumerate(results):
+            for j, label in enumerate(labels):
+                if label in sample_label_histograms:
+                    label_histograms[i, j] = sample_label_histograms[label]
+
+        return {
+            'sample_names': np.array([name for name, reads_file_path, read_classes_file_path in samples]),
+            'bin_edges': np.arange(num_bins + 1) * bin_width,
+            'labels': np.array(labels),
+            'histograms': histograms,
+            'label_histograms': label_histograms,
+            'merged_histogram': histograms.sum(axis=0),
+            'merged_label_histograms': label_histograms.sum(axis=0),
+        }
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+
+    print()
+
+
+    samples = [
+        ('ivt_cy1_gRNA', 'all_reads_ivt_cy1_gRNA.fastq', 'read_classes_ivt_cy1_gRNA.tsv'),
+        ('cy1_nb_2wpi_leaf', 'all_reads_cy1_nb_2wpi_leaf.fastq', 'read_classes_cy1_nb_2wpi_leaf.tsv'),
+        ('cy1_nb_2wpi_root', 'all_reads_cy1_nb_2wpi_root.fastq', 'read_classes_cy1_nb_2wpi_root.tsv'),
+        ('cy1_nb_6wpi_leaf', 'all_reads_cy1_nb_6wpi_leaf.fastq', 'read_classes_cy1_nb_6wpi_leaf.tsv'),
+        ('cy1_nb_6wpi_root', 'all_reads_cy1_nb_6wpi_root.fastq', 'read_classes_cy1_nb_6wpi_root.tsv'),
+        ('cy2_nb_14wpi_leaf', 'all_reads_cy2_nb_14wpi_leaf.fastq', None),
+        ('cy2_hemp_leaf', 'all_reads_cy2_hemp_leaf.fastq', None),
+    ]
+
+    print(f'{len(samples)=}')
+    print()
+
+
+    bin_width = 10
+    num_bins = 1000
+
+    read_length_histograms = ReadLengthHistograms.for_(samples, bin_width=bin_width, num_bins=num_bins)
+    print('Successfully computed read length histograms!')
+    print()
+
+
+    for sample_name, histogram in zip(read_length_histograms['sample_names'], read_length_histograms['histograms']):
+        print(f'{sample_name}: {histogram.sum()} reads')
+    print()
+
+    for label, histogram in zip(read_length_histograms['labels'], read_length_histograms['merged_label_histograms']):
+        print(f'{label}: {histogram.sum()} reads')
+    print()
+
+
+    read_length_histograms_file_path = 'read_length_histograms.npz'
+    print(f'{read_length_histograms_file_path=}')
+    print()
+
+    np.savez_compressed(read_length_histograms_file_path, **read_length_histograms)
+    print('Saved read length histograms.')
+    print()
+
+
+    histogram = read_length_histograms['merged_histogram']
+    #histogram = read_length_histograms['histograms'][list(read_length_histograms['sample_names']).index('cy1_nb_6wpi_leaf')]
+    #histogram = read_length_histograms['merged_label_histograms'][list(read_length_histograms['labels']).index('CY1 plus')]
+
+
+    fig, ax = plt.subplots()
+
+    plt.stairs(
+        histogram,
+        read_length_histograms['bin_edges'],
+        color='black',
+        fill=True,
+    )
+
+    ax.set_xticks([0, 150, 225, 500, 1000, 2000, 3000, 4000, 5000, 6000, 7000, 8000])
+
+    plt.xticks(rotation=90)
+
+    plt.show()
@@ -0,0 +1,158 @@
+import numpy as np
+
+from fastq_records import FastqChunks
+
+from read_classes import ReadClasses
+
+
+class QualityStats:
+    @staticmethod
+    def of(qualities, window_width=20, min_window_mean_q=7):
+        """Returns per-read quality stats for a chunk of quality strings (given as bytes).
+
+        Stats are the mean Q, the median Q and the number of low-quality windows
+        (i.e., non-overlapping windows of window-width bases, tiled from the start of the read,
+        with a mean Q below min-window-mean-q).
+
+        All quality strings of the chunk are decoded and reduced at once.
+        """
+        read_lengths = np.array([len(quality) for quality in qualities], dtype=np.int64)
+        assert np.all(read_lengths > 0)
+        read_starts = np.concatenate([[0], np.cumsum(read_lengths)[:-1]])
+
+        q = np.frombuffer(b''.join(qualities), dtype=np.uint8).astype(np.int64) - 33
+        assert np.all((0 <= q) & (q <= 93))
+
+        mean_q = np.add.reduceat(q, read_starts) / read_lengths
+
+        # sorts the Q values of each read (without mixing reads)
+        read_indices = np.repeat(np.arange(len(qualities)), read_lengths)
+        sorted_q = np.sort(read_indices * 128 + q) % 128
+        median_q = (sorted_q[read_starts + (read_lengths - 1) // 2] + sorted_q[read_starts + read_lengths // 2]) / 2
+
+        cumulative_q = np.concatenate([[0], np.cumsum(q)])
+        read_positions = np.arange(len(q)) - np.repeat(read_starts, read_lengths)
+        is_window_start = (read_positions % window_width == 0) \
+            & (read_positions + window_width <= np.repeat(read_lengths, read_lengths))
+        window_starts = np.flatnonzero(is_window_start)
+        window_sums = cumulative_q[window_starts + window_width] - cumulative_q[window_starts]
+        is_low_quality = window_sums < min_window_mean_q * window_width
+        num_low_quality_windows = np.bincount(
+            read_indices[window_starts[is_low_quality]],
+            minlength=len(qualities),
+        )
+
+        return mean_q, median_q, num_low_quality_windows
+
+
+class ReadQuality:
+    @staticmethod
+    def for_(reads_file_path, read_classes_file_path=None, window_width=20, min_window_mean_q=7):
+        """Returns per-read quality stats for all reads in the FASTQ file as arrays.
+
+        If a read classes file is given, the species, strand class and number of hsps
+        of each read are joined to the stats (reads not in the file get "unclassified" and -1).
+        """
+        read_classes = {} if read_classes_file_path is None else ReadClasses.in_(read_classes_file_path)
+
+        read_ids = []
+        read_lengths = []
+        mean_q = []
+        median_q = []
+        num_low_quality_windows = []
+
+        for records in FastqChunks.in_(reads_file_path):
+            qualities = [quality for read_id, read_seq, quality in records]
+            chunk_mean_q, chunk_median_q, chunk_num_low_quality_windows = QualityStats.of(
+                qualities,
+                window_width=window_width,
+                min_window_mean_q=min_window_mean_q,
+            )
+            read_ids.extend(read_id for read_id, read_seq, quality in records)
+            read_lengths.extend(len(quality) for quality in qualities)
+            mean_q.append(chunk_mean_q)
+            median_q.append(chunk_median_q)
+            num_low_quality_windows.append(chunk_num_low_quality_windows)
+
+        unclassified = ('unclassified', 'unclassified', -1)
+        classes = [read_classes.get(read_id, unclassified) for read_id in read_ids]
+
+        return {
+            'read_ids': np.array(read_ids, dtype='S36'),
+            'read_lengths': np.array(read_lengths, dtype=np.int64),
+            'mean_q': np.concatenate(mean_q),
+            'median_q': np.concatenate(median_q),
+            'num_low_quality_windows': np.concatenate(num_low_quality_windows),
+            'species': np.array([species for species, strand_class, num_hsps in classes]),
+            'strand_classes': np.array([strand_class for species, strand_class, num_hsps in classes]),
+            'num_hsps': np.array([num_hsps for species, strand_class, num_hsps in classes], dtype=np.int64),
+        }
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+
+    print()
+
+
+    reads_file_path = 'all_reads_cy1_nb_6wpi_leaf.fastq'
+    print(f'{reads_file_path=}')
+    print()
+
+    read_classes_file_path = 'read_classes_cy1_nb_6wpi_leaf.tsv'
+    print(f'{read_classes_file_path=}')
+    print()
+
+
+    read_quality = ReadQuality.for_(reads_file_path, read_classes_file_path)
+    print(f'{len(read_quality["read_ids"])=}')
+    print()
+
+
+    read_quality_file_path = 'read_quality_' + reads_file_path.removeprefix('all_reads_').removesuffix('.fastq') + '.npz'
+    print(f'{read_quality_file_path=}')
+    print()
+
+    np.savez_compressed(read_quality_file_path, **read_quality)
+    print('Saved read quality.')
+    print()
+
+
+    for species in np.unique(read_quality['species']):
+        for strand_class in np.unique(read_quality['strand_classes'][read_quality['species'] == species]):
+            is_in_class = (read_quality['species'] == species) & (read_quality['strand_classes'] == strand_class)
+            print(f'{species} {strand_class}: {is_in_class.sum()} reads, mean of mean Q = {read_quality["mean_q"][is_in_class].mean():.2f}')
+    print()
+
+
+    is_viral = np.isin(read_quality['species'], ['CY1', 'CY2'])
+
+    # fragmented reads have more than one hsp
+    num_hsps_groups = [1, 2, 3]
+
+    mean_q_by_num_hsps = [
+        read_quality['mean_q'][is_viral & (
+            read_quality['num_hsps'] == num_hsps if num_hsps < num_hsps_groups[-1] else read_quality['num_hsps'] >= num_hsps
+        )]
+        for num_hsps in num_hsps_groups
+    ]
+
+    for num_hsps, group_mean_q in zip(num_hsps_groups, mean_q_by_num_hsps):
+        print(f'{num_hsps=}: {len(group_mean_q)} reads, median of mean Q = {np.median(group_mean_q) if len(group_mean_q) > 0 else np.nan:.2f}')
+    print()
+
+
+    fig, ax = plt.subplots()
+
+    parts = plt.violinplot(
+        [group_mean_q for group_mean_q in mean_q_by_num_hsps if len(group_mean_q) > 0],
+        showextrema=False,
+    )
+
+    for pc in parts['bodies']:
+        pc.set_facecolor('black')
+        pc.set_edgecolor('black')
+        pc.set_alpha(1)
+
+    plt.show()
@@ -0,0 +1,453 @@
+import concurrent.futures
+
+import json
+
+import os
+
+import numpy as np
+
+from fastq_records import map_chunks
+
+from kmers import Codes, ReverseComplementCodes, KmerCodes, FastaSeqs
+
+
+class ReferenceIndex:
+    """A k-mer index of both strands of the (small) reference sequences in a FASTA file.
+
+    Each strand of each reference is a target:
+    target 2 * r is the plus strand of reference r and target 2 * r + 1 is its minus strand
+    (i.e., the reverse complement, which minus-strand reads align to).
+    """
+
+    def __init__(self, reference_file_path, k):
+        self.k = k
+        self.names = []
+        self.lengths = []
+        self.target_codes = []
+
+        kmer_codes = []
+        target_indices = []
+        target_positions = []
+
+        for name, seq in FastaSeqs.in_(reference_file_path):
+            codes = Codes.of(seq)
+            self.names.append(name)
+            self.lengths.append(len(codes))
+            for target_codes in [codes, ReverseComplementCodes.of(codes)]:
+                target_index = len(self.target_codes)
+                self.target_codes.append(target_codes)
+                target_kmer_codes, is_valid = KmerCodes.of(target_codes, k)
+                kmer_codes.append(target_kmer_codes[is_valid])
+                target_indices.append(np.full(is_valid.sum(), target_index, dtype=np.int64))
+                target_positions.append(np.flatnonzero(is_valid))
+
+        kmer_codes = np.concatenate(kmer_codes)
+        order = np.argsort(kmer_codes, kind='stable')
+        self.kmer_codes = kmer_codes[order]
+        self.kmer_target_indices = np.concatenate(target_indices)[order]
+        self.kmer_target_positions = np.concatenate(target_positions)[order]
+
+    def seeds_for(self, query_codes, max_occurrences=8):
+        """Returns the (query positions, target indices, target positions) of exact k-mer matches.
+
+        K-mers occurring more than max-occurrences times in the index are skipped.
+        """
+        kmer_codes, is_valid = KmerCodes.of(query_codes, self.k)
+        query_positions = np.flatnonzero(is_valid)
+        kmer_codes = kmer_codes[is_valid]
+        firsts = np.searchsorted(self.kmer_codes, kmer_codes, side='left')
+        lasts = np.searchsorted(self.kmer_codes, kmer_codes, side='right')
+        counts = lasts - firsts
+        counts[counts > max_occurrences] = 0
+        num_seeds = int(counts.sum())
+        # expands each [first, last) range of matches
+        offsets = np.arange(num_seeds) - np.repeat(np.cumsum(counts) - counts, counts)
+        matches = np.repeat(firsts, counts) + offsets
+        return (
+            np.repeat(query_positions, counts),
+            self.kmer_target_indices[matches],
+            self.kmer_target_positions[matches],
+        )
+
+
+class Chains:
+    @staticmethod
+    def of(query_positions, target_indices, target_positions, k, band=16, max_gap=100, min_seed_coverage=22):
+        """Chains seeds that lie on nearby diagonals of the same target and are close on the query.
+
+        Seeds are overlapping k-mers, so chains are scored by their seed coverage
+        (the number of query positions covered by their seeds) rather than their number of seeds
+        (e.g., a single 14-nt exact match is 4 seeds but only covers 14 positions).
+
+        Returns a list of (seed coverage, target index, query start, query end, target start, target end)
+        with 0-based, half-open starts and ends (not including k, which callers must add to the ends).
+        """
+        if len(query_positions) == 0:
+            return []
+
+        diagonals = target_positions - query_positions
+
+        # clusters seeds on the same target whose diagonals are within the band of each other
+        order = np.lexsort((query_positions, diagonals, target_indices))
+        is_new_cluster = np.ones(len(order), dtype=bool)
+        is_new_cluster[1:] = (target_indices[order][1:] != target_indices[order][:-1]) \
+            | (diagonals[order][1:] - diagonals[order][:-1] > band)
+        cluster_ids = np.empty(len(order), dtype=np.int64)
+        cluster_ids[order] = np.cumsum(is_new_cluster)
+
+        # splits clusters wherever seeds are too far apart on the query
+        order = np.lexsort((query_positions, cluster_ids))
+        sorted_query_positions = query_positions[order]
+        is_new_chain = np.ones(len(order), dtype=bool)
+        is_new_chain[1:] = (cluster_ids[order][1:] != cluster_ids[order][:-1]) \
+            | (sorted_query_positions[1:] - sorted_query_positions[:-1] > max_gap)
+        chain_starts = np.flatnonzero(is_new_chain)
+        chain_ends = np.concatenate([chain_starts[1:], [len(order)]])
+
+        # each seed covers the positions up to the next seed of the chain (at most k of them)
+        next_seed_distances = np.full(len(order), k, dtype=np.int64)
+        next_seed_distances[:-1] = np.minimum(sorted_query_positions[1:] - sorted_query_positions[:-1], k)
+        next_seed_distances[chain_ends - 1] = k
+        seed_coverages = np.add.reduceat(next_seed_distances, chain_starts)
+
+        chains = []
+        for first, last, seed_coverage in zip(chain_starts, chain_ends, seed_coverages):
+            if seed_coverage < min_seed_coverage:
+                continue
+            first_seed = order[first]
+            last_seed = order[last - 1]
+            chains.append((
+                int(seed_coverage),
+                int(target_indices[first_seed]),
+                int(query_positions[first_seed]),
+                int(query_positions[last_seed]),
+                int(target_positions[first_seed]),
+                int(target_positions[last_seed]),
+            ))
+        return chains
+
+
+class BandedExtension:
+    @staticmethod
+    def of(query_codes, target_codes, band=16, max_length=200, match=1, mismatch=-2, gap=-2, x_drop=12):
+        """Returns how many query and target bases the best banded extension consumes, and its score.
+
+        Both sequences are given oriented away from the seed chain
+        (i.e., reversed for extensions to the left).
+        Each row of the dynamic programming matrix is computed at once,
+        with horizontal gaps taken care of by a running maximum.
+        """
+        n = min(len(query_codes), max_length)
+        m = min(len(target_codes), max_length)
+        columns = np.arange(m + 1)
+
+        previous_row = np.where(columns <= band, gap * columns, -np.inf)
+        best_score = 0.0
+        best_i = 0
+        best_j = 0
+
+        for i in range(1, n + 1):
+            in_band = np.abs(columns - i) <= band
+            scores = np.where(target_codes[:m] == query_codes[i - 1], match, mismatch)
+            row = previous_row + gap
+            row[1:] = np.maximum(row[1:], previous_row[:-1] + scores)
+            row = np.where(in_band, row, -np.inf)
+            row = np.maximum.accumulate(row - gap * columns) + gap * columns
+            row = np.where(in_band, row, -np.inf)
+
+            j = int(np.argmax(row))
+            if row[j] > best_score:
+                best_score = row[j]
+                best_i = i
+                best_j = j
+            elif row[j] < best_score - x_drop:
+                break
+
+            previous_row = row
+
+        return best_i, best_j, best_score
+
+
+def hsps_for(query_codes, reference_index, band=16, max_gap=100, min_seed_coverage=22, max_extension_length=200, min_align_length=50, min_score=30, match=1):
+    """Returns the hsps of the read (as (score, reference index, hsp) triples).
+
+    Hsps have the same fields as in BLAST output
+    (query-from < query-to and hit-from > hit-to for a minus hit strand).
+    The score of an hsp is its seed coverage (as matches) plus the scores of both extensions
+    and, much like an e-value cutoff, hsps shorter than min-align-length or scoring below min-score are dropped.
+    """
+    k = reference_index.k
+    query_positions, target_indices, target_positions = reference_index.seeds_for(query_codes)
+    chains = Chains.of(
+        query_positions,
+        target_indices,
+        target_positions,
+        reference_index.k,
+        band=band,
+        max_gap=max_gap,
+        min_seed_coverage=min_seed_coverage,
+    )
+
+    # the best chains first
+    chains.sort(key=lambda chain: -chain[0])
+
+    hsps = []
+    aligned_query_intervals = []
+
+    for seed_coverage, target_index, query_start, query_end, target_start, target_end in chains:
+        query_end += k
+        target_end += k
+
+        # skips chains that mostly overlap a better chain on the query
+        if any(
+            min(query_end, end) - max(query_start, start) > (query_end - query_start) / 2
+            for start, end in aligned_query_intervals
+        ):
+            continue
+
+        target_codes = reference_index.target_codes[target_index]
+
+        left_i, left_j, left_score = BandedExtension.of(
+            query_codes[:query_start][::-1],
+            target_codes[:target_start][::-1],
+            band=band,
+            max_length=max_extension_length,
+            match=match,
+        )
+        right_i, right_j, right_score = BandedExtension.of(
+            query_codes[query_end:],
+            target_codes[target_end:],
+            band=band,
+            max_length=max_extension_length,
+            match=match,
+        )
+        query_start -= left_i
+        target_start -= left_j
+        query_end += right_i
+        target_end += right_j
+
+        score = int(match * seed_coverage + left_score + right_score)
+        align_len = max(query_end - query_start, target_end - target_start)
+        if align_len < min_align_length or score < min_score:
+            continue
+
+        aligned_query_intervals.append((query_start, query_end))
+
+        reference = target_index // 2
+        reference_length = reference_index.lengths[reference]
+        if target_index % 2 == 0:
+            hit_from = target_start + 1
+            hit_to = target_end
+            hit_strand = 'Plus'
+        else:
+            # minus-strand targets are reverse complements
+            hit_from = reference_length - target_start
+            hit_to = reference_length - target_end + 1
+            hit_strand = 'Minus'
+
+        hsps.append((score, reference, {
+            'score': score,
+            'query_from': query_start + 1,
+            'query_to': query_end,
+            'hit_from': hit_from,
+            'hit_to': hit_to,
+            'query_strand': 'Plus',
+            'hit_strand': hit_strand,
+            'align_len': align_len,
+        }))
+
+    return hsps
+
+
+class Search:
+    @staticmethod
+    def for_(read_id, read_seq, reference_index):
+        """Returns a BLAST-like search for the read against the references."""
+        query_codes = Codes.of(read_seq)
+        hits = {}
+        for score, reference, hsp in hsps_for(query_codes, reference_index):
+            hits.setdefault(reference, []).append(hsp)
+        return {
+            'query_title': read_id.decode(),
+            'query_len': len(read_seq),
+            'hits': [
+                {
+                    'num': num,
+                    'description': [{'title': reference_index.names[reference]}],
+                    'len': reference_index.lengths[reference],
+                    'hsps': [{'num': i + 1, **hsp} for i, hsp in enumerate(reference_hsps)],
+                }
+                for num, (reference, reference_hsps) in enumerate(
+                    sorted(hits.items(), key=lambda item: -sum(hsp['score'] for hsp in item[1])),
+                    start=1,
+                )
+            ],
+        }
+
+
+# set in each worker process by init_worker
+worker_state = {}
+
+
+def init_worker(reference_file_path, k):
+    worker_state['reference_index'] = ReferenceIndex(reference_file_path, k)
+
+
+def align_chunk(records):
+    """Returns the searches for the records of the chunk."""
+    reference_index = worker_state['reference_index']
+    return [Search.for_(read_id, read_seq, reference_index) for read_id, read_seq, quality in records]
+
+
+def align_reads(reads_file_path, reference_file_path, output_file_path, k=11, max_workers=None):
+    """Aligns the reads in the FASTQ file to the references in a process pool.
+
+    Searches are written in the same JSON layout as BLAST output (format 15),
+    so that they can be read in place of BLAST output.
+
+    Returns the number of searches written and the number with a hit.
+    """
+    num_searches = 0
+    num_searches_with_a_hit = 0
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=init_worker,
+        initargs=(reference_file_path, k),
+    ) as executor:
+        with open(output_file_path, 'w', buffering=1 << 22) as f:
+            f.write('{"BlastOutput2": [\n')
+            for searches in map_chunks(
+                executor,
+                align_chunk,
+                reads_file_path,
+                chunk_size=1 << 20,
+                max_pending=2 * (max_workers or os.cpu_count() or 1),
+            ):
+                for search in searches:
+                    if num_searches > 0:
+                        f.write(',\n')
+                    f.write(json.dumps({'report': {'program': 'seed_and_extend', 'results': {'search': search}}}))
+                    num_searches += 1
+                    num_searches_with_a_hit += len(search['hits']) > 0
+            f.write('\n]}\n')
+
+    return num_searches, num_searches_with_a_hit
+
+
+class StrandClass:
+    @staticmethod
+    def of(hit):
+        """Returns the strand class (plus, minus or plus_minus_hybrid) of the hit."""
+        hit_strands = set(hsp['hit_strand'] for hsp in hit['hsps'])
+        if hit_strands == {'Plus'}:
+            return 'plus'
+        elif hit_strands == {'Minus'}:
+            return 'minus'
+        else:
+            return 'plus_minus_hybrid'
+
+
+class Comparison:
+    @staticmethod
+    def of(output, blast_output):
+        """Compares searches in the output to the searches for the same reads in the BLAST output.
+
+        Returns counts of agreement on having a hit, on the strand class and on the number of hsps,
+        along with the hit position differences of reads with a single hsp in both.
+        """
+        searches = {
+            item['report']['results']['search']['query_title']: item['report']['results']['search']
+            for item in output['BlastOutput2']
+        }
+        blast_searches = {
+            item['report']['results']['search']['query_title']: item['report']['results']['search']
+            for item in blast_output['BlastOutput2']
+        }
+
+        comparison = {
+            'num_reads': 0,
+            'num_with_a_hit_in_both': 0,
+            'num_with_a_hit_only_in_blast': 0,
+            'num_with_a_hit_only_in_output': 0,
+            'num_same_strand_class': 0,
+            'num_same_num_hsps': 0,
+        }
+        hit_from_differences = []
+        hit_to_differences = []
+
+        for read_id, blast_search in blast_searches.items():
+            if read_id not in searches:
+                continue
+            search = searches[read_id]
+            comparison['num_reads'] += 1
+            has_a_hit = len(search['hits']) > 0
+            blast_has_a_hit = len(blast_search['hits']) > 0
+            if has_a_hit and blast_has_a_hit:
+                comparison['num_with_a_hit_in_both'] += 1
+            elif blast_has_a_hit:
+                comparison['num_with_a_hit_only_in_blast'] += 1
+                continue
+            elif has_a_hit:
+                comparison['num_with_a_hit_only_in_output'] += 1
+                continue
+            else:
+                continue
+
+            hit = search['hits'][0]
+            blast_hit = blast_search['hits'][0]
+            comparison['num_same_strand_class'] += StrandClass.of(hit) == StrandClass.of(blast_hit)
+            comparison['num_same_num_hsps'] += len(hit['hsps']) == len(blast_hit['hsps'])
+            if len(hit['hsps']) == 1 and len(blast_hit['hsps']) == 1:
+                hit_from_differences.append(hit['hsps'][0]['hit_from'] - blast_hit['hsps'][0]['hit_from'])
+                hit_to_differences.append(hit['hsps'][0]['hit_to'] - blast_hit['hsps'][0]['hit_to'])
+
+        return comparison, np.array(hit_from_differences), np.array(hit_to_differences)
+
+
+if __name__ == '__main__':
+    print()
+
+
+    reads_file_path = 'all_reads_ivt_cy1_gRNA.fastq'
+    print(f'{reads_file_path=}')
+    print()
+
+    # CY1 and CY2
+    reference_file_path = 'cy1_cy2.fasta'
+    print(f'{reference_file_path=}')
+    print()
+
+
+    output_file_path = 'seed_and_extend_output_ivt_cy1_gRNA.json'
+    print(f'{output_file_path=}')
+    print()
+
+    num_searches, num_searches_with_a_hit = align_reads(reads_file_path, reference_file_path, output_file_path)
+    print(f'{num_searches=}')
+    print(f'{num_searches_with_a_hit=}')
+    print()
+
+
+    # checks the output against the BLAST output for the same reads
+    blast_output_file_path = 'blast_output_ivt_cy1_gRNA.json'
+    print(f'{blast_output_file_path=}')
+    print()
+
+    with open(output_file_path, 'r') as f:
+        output = json.loads(f.read())
+
+    with open(blast_output_file_path, 'r') as f:
+        blast_output = json.loads(f.read())
+    print('Successfully parsed BLAST output.')
+    print()
+
+    comparison, hit_from_differences, hit_to_differences = Comparison.of(output, blast_output)
+    for key, value in comparison.items():
+        print(f'{key}: {value}')
+    print()
+
+    if len(hit_from_differences) > 0:
+        print(f'{np.median(np.abs(hit_from_differences))=}')
+        print(f'{np.median(np.abs(hit_to_differences))=}')
+        print()
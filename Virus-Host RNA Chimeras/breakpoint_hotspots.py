@@ -0,0 +1,120 @@
+import numpy as np
+
+from chimera_join import JoinedRecords
+
+from chimera_breakpoints import Breakpoints
+
+
+class SweepClusterIndices:
+    @staticmethod
+    def of(group_indices, positions, tolerance):
+        """Returns the cluster index of each position, clustering positions within each group in a sorted sweep.
+
+        Positions are chained into the same cluster while consecutive sorted positions
+        (in the same group) are at most the tolerance apart.
+        """
+        order = np.lexsort((positions, group_indices))
+        sorted_groups = group_indices[order]
+        sorted_positions = positions[order]
+        is_cluster_start = np.ones(len(order), dtype=bool)
+        is_cluster_start[1:] = (sorted_groups[1:] != sorted_groups[:-1]) \
+            | (sorted_positions[1:] - sorted_positions[:-1] > tolerance)
+        cluster_indices = np.empty(len(order), dtype=np.int64)
+        cluster_indices[order] = np.cumsum(is_cluster_start) - 1
+        return cluster_indices
+
+
+class BreakpointHotspots:
+    @staticmethod
+    def of(breakpoints, host_tolerance=10, cy1_tolerance=10):
+        """Returns the clusters of breakpoints with nearby host and CY1 positions, sorted by support (most first).
+
+        Breakpoints are swept along host positions on each host contig first,
+        then each host cluster is swept along CY1 positions, so no breakpoints are compared pairwise.
+        Each cluster is a dictionary with its host contig, host and CY1 position ranges,
+        support (the number of reads) and read IDs.
+        """
+        contigs, contig_indices = np.unique(breakpoints['host_contigs'], return_inverse=True)
+        host_cluster_indices = SweepClusterIndices.of(contig_indices, breakpoints['host_positions'], host_tolerance)
+        cluster_indices = SweepClusterIndices.of(host_cluster_indices, breakpoints['cy1_positions'], cy1_tolerance)
+
+        if len(cluster_indices) == 0:
+            return []
+        num_clusters = int(cluster_indices.max()) + 1
+        supports = np.bincount(cluster_indices, minlength=num_clusters)
+        order = np.argsort(cluster_indices, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(supports)[:-1]])
+
+        def ranges(positions):
+            sorted_positions = positions[order]
+            return np.minimum.reduceat(sorted_positions, starts), np.maximum.reduceat(sorted_positions, starts)
+
+        host_starts, host_ends = ranges(breakpoints['host_positions'])
+        cy1_starts, cy1_ends = ranges(breakpoints['cy1_positions'])
+        cluster_contigs = contigs[contig_indices[order][starts]]
+        read_ids = breakpoints['read_ids'][order]
+
+        clusters = [
+            {
+                'host_contig': str(cluster_contigs[i]),
+                'host_start': int(host_starts[i]),
+                'host_end': int(host_ends[i]),
+                'cy1_start': int(cy1_starts[i]),
+                'cy1_end': int(cy1_ends[i]),
+                'support': int(supports[i]),
+                'read_ids': [str(read_id) for read_id in read_ids[starts[i]:starts[i] + supports[i]]],
+            }
+            for i in range(num_clusters)
+        ]
+        clusters.sort(key=lambda cluster : cluster['support'], reverse=True)
+        return clusters
+
+
+def write_hotspots(clusters, hotspots_file_path):
+    """Writes the clusters to a tab-separated file (one row per cluster, read IDs comma-separated)."""
+    with open(hotspots_file_path, 'w', buffering=1 << 20) as f:
+        f.write('cluster\thost_contig\thost_start\thost_end\tcy1_start\tcy1_end\tsupport\tread_ids\n')
+        for i, cluster in enumerate(clusters):
+            f.write(
+                f'{i}\t{cluster["host_contig"]}\t{cluster["host_start"]}\t{cluster["host_end"]}'
+                f'\t{cluster["cy1_start"]}\t{cluster["cy1_end"]}\t{cluster["support"]}\t{",".join(cluster["read_ids"])}\n'
+            )
+
+
+if __name__ == '__main__':
+    print()
+
+
+    joined_file_path = 'joined_hits_cy1_nb_6wpi_leaf.jsonl'
+    print(f'{joined_file_path=}')
+    print()
+
+    host_database = 'nb_genome'
+    #host_database = 'nb_transcripts'
+    print(f'{host_database=}')
+    print()
+
+
+    breakpoints = Breakpoints.for_(JoinedRecords.in_(joined_file_path), host_database)
+    print(f'{len(breakpoints["read_ids"])=}')
+    print()
+
+
+    clusters = BreakpointHotspots.of(breakpoints, host_tolerance=10, cy1_tolerance=10)
+    print(f'{len(clusters)=}')
+    print(f'{sum(cluster["support"] > 1 for cluster in clusters)=}')
+    print()
+
+    for cluster in clusters[:10]:
+        print(
+            f'{cluster["host_contig"]}:{cluster["host_start"]}-{cluster["host_end"]}'
+            f' CY1:{cluster["cy1_start"]}-{cluster["cy1_end"]} support={cluster["support"]}'
+        )
+    print()
+
+
+    hotspots_file_path = f'breakpoint_hotspots_{host_database}_' + joined_file_path.removeprefix('joined_hits_').removesuffix('.jsonl') + '.tsv'
+    print(f'{hotspots_file_path=}')
+    print()
+
+    write_hotspots(clusters, hotspots_file_path)
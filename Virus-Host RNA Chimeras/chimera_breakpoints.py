@@ -0,0 +1,197 @@
+import numpy as np
+
+from chimera_join import JoinedRecords
+
+
+cy1_genome_length = 2692
+
+
+class HspArrays:
+    @staticmethod
+    def for_(hit_summaries_by_read):
+        """Returns a dictionary of arrays with a row for each hsp of the hit summaries.
+
+        Hit summaries are given for each read (and only the first, i.e., best, hit of each read is used).
+        Rows have the read index, query from, query to, hit from, hit to and whether the hit strand is plus.
+        """
+        rows = [
+            (read_index, query_from, query_to, hit_from, hit_to, hit_strand == 'Plus')
+            for read_index, hit_summaries in enumerate(hit_summaries_by_read)
+            for query_from, query_to, hit_from, hit_to, hit_strand in hit_summaries[0]['hsps']
+        ]
+        columns = np.array(rows, dtype=np.int64).reshape(-1, 6).T
+        return {
+            'read_indices': columns[0],
+            'query_froms': columns[1],
+            'query_tos': columns[2],
+            'hit_froms': columns[3],
+            'hit_tos': columns[4],
+            'is_plus': columns[5].astype(bool),
+        }
+
+
+class ExtremeHspIndices:
+    @staticmethod
+    def in_(read_indices, values, num_reads):
+        """Returns the index of the hsp with the lowest and the highest value for each read (every read must have an hsp)."""
+        order = np.lexsort((values, read_indices))
+        firsts = np.searchsorted(read_indices[order], np.arange(num_reads), side='left')
+        lasts = np.searchsorted(read_indices[order], np.arange(num_reads), side='right') - 1
+        assert np.all(lasts >= firsts)
+        return order[firsts], order[lasts]
+
+
+class Breakpoints:
+    @staticmethod
+    def for_(records, host_database):
+        """Returns a dictionary of breakpoint arrays (one entry per read) for chimeric reads with CY1 and host hits.
+
+        The viral part of a read spans its CY1 hsps and the host part spans the hsps of its best host hit.
+        The junction is at the end of the viral part facing the host part:
+            the junction read position is the last viral position before the host part
+            (or the first viral position after it),
+            the CY1 position and host position are the hit positions aligned at either side of the junction,
+            and the gap is the number of read positions between the parts (negative for an overlap).
+        All positions are 1-based.
+        """
+        records = [record for record in records if 'cy1' in record['hits'] and host_database in record['hits']]
+        num_reads = len(records)
+        read_lengths = np.array([record['read_length'] for record in records], dtype=np.int64)
+
+        viral = HspArrays.for_([record['hits']['cy1'] for record in records])
+        host = HspArrays.for_([record['hits'][host_database] for record in records])
+
+        viral_first_hsps, _ = ExtremeHspIndices.in_(viral['read_indices'], viral['query_froms'], num_reads)
+        _, viral_last_hsps = ExtremeHspIndices.in_(viral['read_indices'], viral['query_tos'], num_reads)
+        host_first_hsps, _ = ExtremeHspIndices.in_(host['read_indices'], host['query_froms'], num_reads)
+        _, host_last_hsps = ExtremeHspIndices.in_(host['read_indices'], host['query_tos'], num_reads)
+
+        viral_starts = viral['query_froms'][viral_first_hsps]
+        viral_ends = viral['query_tos'][viral_last_hsps]
+        host_starts = host['query_froms'][host_first_hsps]
+        host_ends = host['query_tos'][host_last_hsps]
+
+        # compares midpoints (times two)
+        is_viral_first = viral_starts + viral_ends <= host_starts + host_ends
+
+        viral_junction_hsps = np.where(is_viral_first, viral_last_hsps, viral_first_hsps)
+        host_junction_hsps = np.where(is_viral_first, host_first_hsps, host_last_hsps)
+
+        junction_read_positions = np.where(is_viral_first, viral_ends, viral_starts)
+        gaps = np.where(is_viral_first, host_starts - viral_ends - 1, viral_starts - host_ends - 1)
+        # query from aligns to hit from and query to aligns to hit to (on either hit strand)
+        cy1_positions = np.where(is_viral_first, viral['hit_tos'][viral_junction_hsps], viral['hit_froms'][viral_junction_hsps])
+        host_positions = np.where(is_viral_first, host['hit_froms'][host_junction_hsps], host['hit_tos'][host_junction_hsps])
+
+        return {
+            'read_ids': np.array([record['read_id'] for record in records]),
+            'read_lengths': read_lengths,
+            # the contig is the first word of the title
+            'host_contigs': np.array([record['hits'][host_database][0]['title'].split()[0] for record in records]),
+            'is_viral_first': is_viral_first,
+            'junction_read_positions': junction_read_positions,
+            'normalized_junction_read_positions': junction_read_positions / read_lengths,
+            'cy1_positions': cy1_positions,
+            'is_cy1_plus': viral['is_plus'][viral_junction_hsps],
+            'host_positions': host_positions,
+            'is_host_plus': host['is_plus'][host_junction_hsps],
+            'gaps': gaps,
+        }
+
+
+def write_breakpoints(breakpoints, breakpoints_file_path):
+    """Writes the breakpoints to a tab-separated file (one row per read)."""
+    with open(breakpoints_file_path, 'w', buffering=1 << 20) as f:
+        f.write(
+            'read_id\tread_length\thost_contig\tviral_part\tjunction_read_position\tnormalized_junction_read_position'
+            '\tcy1_position\tcy1_strand\thost_position\thost_strand\tgap\n'
+        )
+        for i, read_id in enumerate(breakpoints['read_ids']):
+            f.write('\t'.join([
+                read_id,
+                str(breakpoints['read_lengths'][i]),
+                breakpoints['host_contigs'][i],
+                '5prime' if breakpoints['is_viral_first'][i] else '3prime',
+                str(breakpoints['junction_read_positions'][i]),
+                f'{breakpoints["normalized_junction_read_positions"][i]:.4f}',
+                str(breakpoints['cy1_positions'][i]),
+                'Plus' if breakpoints['is_cy1_plus'][i] else 'Minus',
+                str(breakpoints['host_positions'][i]),
+                'Plus' if breakpoints['is_host_plus'][i] else 'Minus',
+                str(breakpoints['gaps'][i]),
+            ]) + '\n')
+
+
+class BreakpointHistogram:
+    @staticmethod
+    def of(breakpoints, cy1_bin_width=50, num_read_position_bins=50):
+        """Returns the 2D histogram of CY1 positions (rows) by normalized junction read positions (columns),
+        with the CY1 bin edges and read position bin edges.
+        """
+        cy1_bin_edges = np.arange(1, cy1_genome_length + cy1_bin_width, cy1_bin_width)
+        read_position_bin_edges = np.linspace(0, 1, num_read_position_bins + 1)
+        histogram, _, _ = np.histogram2d(
+            breakpoints['cy1_positions'],
+            breakpoints['normalized_junction_read_positions'],
+            bins=[cy1_bin_edges, read_position_bin_edges],
+        )
+        return histogram.astype(np.int64), cy1_bin_edges, read_position_bin_edges
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+
+    print()
+
+
+    joined_file_path = 'joined_hits_cy1_nb_6wpi_leaf.jsonl'
+    print(f'{joined_file_path=}')
+    print()
+
+    host_database = 'nb_genome'
+    #host_database = 'nb_transcripts'
+    print(f'{host_database=}')
+    print()
+
+
+    breakpoints = Breakpoints.for_(JoinedRecords.in_(joined_file_path), host_database)
+    print(f'{len(breakpoints["read_ids"])=}')
+    print(f'{breakpoints["is_viral_first"].sum()=}')
+    print(f'{(breakpoints["gaps"] < 0).sum()=}')
+    print(f'{(breakpoints["gaps"] == 0).sum()=}')
+    print(f'{(breakpoints["gaps"] > 0).sum()=}')
+    print()
+
+
+    breakpoints_file_path = f'breakpoints_{host_database}_' + joined_file_path.removeprefix('joined_hits_').removesuffix('.jsonl') + '.tsv'
+    print(f'{breakpoints_file_path=}')
+    print()
+
+    write_breakpoints(breakpoints, breakpoints_file_path)
+
+
+    histogram, cy1_bin_edges, read_position_bin_edges = BreakpointHistogram.of(breakpoints)
+
+    np.savez(
+        breakpoints_file_path.removesuffix('.tsv') + '_histogram.npz',
+        histogram=histogram,
+        cy1_bin_edges=cy1_bin_edges,
+        read_position_bin_edges=read_position_bin_edges,
+    )
+
+
+    fig, ax = plt.subplots()
+
+    ax.imshow(
+        histogram,
+        origin='lower',
+        aspect='auto',
+        extent=[read_position_bin_edges[0], read_position_bin_edges[-1], cy1_bin_edges[0], cy1_bin_edges[-1]],
+        cmap='Greys',
+    )
+
+    ax.set_xlabel('junction position / read length')
+    ax.set_ylabel('CY1 position')
+
+    plt.show()
@@ -0,0 +1,233 @@
+import heapq
+
+import itertools
+
+import json
+
+import os
+
+import tempfile
+
+
+class BlastItems:
+    @staticmethod
+    def in_(blast_output_file_path, buffer_size=1 << 22):
+        """Yields the items of the BlastOutput2 list in the BLAST JSON output one at a time.
+
+        The file is read in buffers of about buffer-size characters and each item is decoded
+        as soon as it is complete, so only one item is held in memory at once
+        (rather than the parse tree of the whole output).
+        """
+        decoder = json.JSONDecoder()
+        with open(blast_output_file_path, 'r') as f:
+            buffer = ''
+            position = 0
+            is_at_end = False
+
+            def read_more():
+                nonlocal buffer, position, is_at_end
+                chunk = f.read(buffer_size)
+                if chunk == '':
+                    is_at_end = True
+                buffer = buffer[position:] + chunk
+                position = 0
+
+            def skip_whitespace():
+                nonlocal position
+                while True:
+                    while position < len(buffer) and buffer[position].isspace():
+                        position += 1
+                    if position < len(buffer) or is_at_end:
+                        return
+                    read_more()
+
+            # finds the start of the list
+            while True:
+                list_start = buffer.find('"BlastOutput2"')
+                if list_start >= 0:
+                    list_start = buffer.find('[', list_start)
+                if list_start >= 0:
+                    position = list_start + 1
+                    break
+                assert not is_at_end
+                read_more()
+
+            while True:
+                skip_whitespace()
+                assert position < len(buffer)
+                if buffer[position] == ']':
+                    return
+                if buffer[position] == ',':
+                    position += 1
+                    skip_whitespace()
+                while True:
+                    try:
+                        item, end = decoder.raw_decode(buffer, position)
+                        break
+                    except json.JSONDecodeError:
+                        # the item is not complete yet
+                        assert not is_at_end
+                        read_more()
+                position = end
+                yield item
+
+
+class HitSummary:
+    @staticmethod
+    def for_(hit):
+        """Returns a compact summary of the hit (its title and hsps).
+
+        Hsps are (query from, query to, hit from, hit to, hit strand) lists.
+        """
+        return {
+            'title': hit['description'][0]['title'],
+            'hsps': [
+                [hsp['query_from'], hsp['query_to'], hsp['hit_from'], hsp['hit_to'], hsp['hit_strand']]
+                for hsp in hit['hsps']
+            ],
+        }
+
+
+class SearchSummaries:
+    @staticmethod
+    def in_(blast_output_file_path):
+        """Yields the (read ID, read length, hit summaries) of each search with a hit in the BLAST output."""
+        for item in BlastItems.in_(blast_output_file_path):
+            search = item['report']['results']['search']
+            if len(search['hits']) == 0:
+                continue
+            read_id = search['query_title']
+            # all read IDs should be UUIDs
+            assert len(read_id) == 36
+            yield read_id, search['query_len'], [HitSummary.for_(hit) for hit in search['hits']]
+
+
+def write_run(lines, run_dir_path, run_index):
+    """Writes the lines sorted to a new run file and returns its path."""
+    lines.sort()
+    run_file_path = os.path.join(run_dir_path, f'run_{run_index}.tsv')
+    with open(run_file_path, 'w', buffering=1 << 20) as f:
+        f.writelines(lines)
+    return run_file_path
+
+
+class RunFiles:
+    @staticmethod
+    def for_(blast_output_file_paths, run_dir_path, max_run_size=1 << 18):
+        """Writes the searches with a hit in each BLAST output to sorted run files and returns their paths.
+
+        Run lines are (read ID, database index, read length, hit summaries as JSON), tab-separated,
+        and each run file has at most max-run-size lines sorted by read ID (then database index).
+        """
+        run_file_paths = []
+        for database_index, blast_output_file_path in enumerate(blast_output_file_paths):
+            lines = []
+            for read_id, read_length, hit_summaries in SearchSummaries.in_(blast_output_file_path):
+                lines.append(f'{read_id}\t{database_index}\t{read_length}\t{json.dumps(hit_summaries)}\n')
+                if len(lines) >= max_run_size:
+                    run_file_paths.append(write_run(lines, run_dir_path, len(run_file_paths)))
+                    lines = []
+            if len(lines) > 0:
+                run_file_paths.append(write_run(lines, run_dir_path, len(run_file_paths)))
+        return run_file_paths
+
+
+class MergedRuns:
+    @staticmethod
+    def in_(run_file_paths):
+        """Yields the (read ID, [(database index, read length, hit summaries), ...]) of each read in the run files.
+
+        Runs are k-way merged, so reads come in read ID order with only one line of each run in memory.
+        """
+        run_files = [open(run_file_path, 'r', buffering=1 << 16) for run_file_path in run_file_paths]
+        try:
+            merged_lines = heapq.merge(*run_files)
+            split_lines = (line.rstrip('\n').split('\t', 3) for line in merged_lines)
+            for read_id, fields in itertools.groupby(split_lines, key=lambda fields : fields[0]):
+                yield read_id, [
+                    (int(database_index), int(read_length), json.loads(hit_summaries))
+                    for read_id, database_index, read_length, hit_summaries in fields
+                ]
+        finally:
+            for run_file in run_files:
+                run_file.close()
+
+
+def join_blast_outputs(blast_output_file_paths, database_names, joined_file_path, min_databases=1, max_run_size=1 << 18):
+    """Joins the searches with a hit in each BLAST output by read ID and writes a record for each read.
+
+    Records are JSON lines with the read ID, the read length and the hit summaries in each database
+    (keyed by database name); only reads with a hit in at least min-databases databases are written
+    (e.g., 2 for chimeric reads).
+    Memory is bounded by the run size (not by the size of the BLAST outputs).
+
+    Returns the number of reads with a hit in each number of databases.
+    """
+    assert len(blast_output_file_paths) == len(database_names)
+    num_reads_by_num_databases = [0] * (len(database_names) + 1)
+
+    with tempfile.TemporaryDirectory() as run_dir_path:
+        run_file_paths = RunFiles.for_(blast_output_file_paths, run_dir_path, max_run_size=max_run_size)
+        with open(joined_file_path, 'w', buffering=1 << 20) as f:
+            for read_id, database_hits in MergedRuns.in_(run_file_paths):
+                read_lengths = set(read_length for database_index, read_length, hit_summaries in database_hits)
+                # the same read should have the same length in every database
+                assert len(read_lengths) == 1
+                num_databases = len(database_hits)
+                num_reads_by_num_databases[num_databases] += 1
+                if num_databases < min_databases:
+                    continue
+                f.write(json.dumps({
+                    'read_id': read_id,
+                    'read_length': read_lengths.pop(),
+                    'hits': {
+                        database_names[database_index]: hit_summaries
+                        for database_index, read_length, hit_summaries in database_hits
+                    },
+                }) + '\n')
+
+    return num_reads_by_num_databases
+
+
+class JoinedRecords:
+    @staticmethod
+    def in_(joined_file_path):
+        """Yields the joined record of each read in the file one at a time."""
+        with open(joined_file_path, 'r') as f:
+            for line in f:
+                yield json.loads(line)
+
+
+if __name__ == '__main__':
+    print()
+
+
+    blast_output_file_paths = [
+        'blast_to_cy1_output_cy1_nb_6wpi_leaf.json',
+        'blast_to_nb_transcripts_output_cy1_nb_6wpi_leaf.json',
+        'blast_to_nb_genome_output_cy1_nb_6wpi_leaf.json',
+    ]
+    database_names = ['cy1', 'nb_transcripts', 'nb_genome']
+    print(f'{blast_output_file_paths=}')
+    print()
+
+
+    joined_file_path = 'joined_hits_cy1_nb_6wpi_leaf.jsonl'
+    print(f'{joined_file_path=}')
+    print()
+
+    num_reads_by_num_databases = join_blast_outputs(blast_output_file_paths, database_names, joined_file_path, min_databases=2)
+    print(f'{num_reads_by_num_databases=}')
+    print()
+
+
+    num_cy1_nb_transcript_chimeric_reads = 0
+    num_cy1_nb_genome_chimeric_reads = 0
+    for record in JoinedRecords.in_(joined_file_path):
+        if 'cy1' in record['hits'] and 'nb_transcripts' in record['hits']:
+            num_cy1_nb_transcript_chimeric_reads += 1
+        if 'cy1' in record['hits'] and 'nb_genome' in record['hits']:
+            num_cy1_nb_genome_chimeric_reads += 1
+    print(f'{num_cy1_nb_transcript_chimeric_reads=}')
+    print(f'{num_cy1_nb_genome_chimeric_reads=}')
+    print()
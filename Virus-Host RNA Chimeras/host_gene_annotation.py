@@ -0,0 +1,203 @@
+import numpy as np
+
+from chimera_join import JoinedRecords
+
+
+class GffAttributes:
+    @staticmethod
+    def of(attributes_field):
+        """Returns a dictionary of the attributes in the attributes column of a GFF3 line."""
+        return dict(
+            attribute.split('=', 1)
+            for attribute in attributes_field.strip().split(';')
+            if '=' in attribute
+        )
+
+
+class GffFeatures:
+    @staticmethod
+    def in_(gff_file_path, feature_types):
+        """Yields the (seqid, start, end, ID, attributes) of each feature of the given types in the GFF3 file.
+
+        Starts and ends are 1-based and inclusive.
+        """
+        with open(gff_file_path, 'r') as f:
+            for line in f:
+                if line.startswith('##FASTA'):
+                    break
+                if line.startswith('#') or line.strip() == '':
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                assert len(fields) == 9
+                if fields[2] not in feature_types:
+                    continue
+                attributes = GffAttributes.of(fields[8])
+                feature_id = attributes.get('ID', attributes.get('Name', f'{fields[0]}:{fields[3]}-{fields[4]}'))
+                start = int(fields[3])
+                end = int(fields[4])
+                assert start <= end
+                yield fields[0], start, end, feature_id, attributes
+
+
+class FeatureIndex:
+    """Features of each seqid sorted by start, with the running maximum of their ends.
+
+    For a query interval, features that start at or before its end come before
+    np.searchsorted(starts, query end, side='right'), and features before
+    np.searchsorted(max ends, query start) all end before it, so only the features
+    in between are candidates (and those that end before the query start are filtered out).
+    """
+
+    def __init__(self, features):
+        features_by_seqid = {}
+        for seqid, start, end, feature_id, attributes in features:
+            features_by_seqid.setdefault(seqid, []).append((start, end, feature_id))
+
+        self.starts = {}
+        self.ends = {}
+        self.max_ends = {}
+        self.ids = {}
+        for seqid, seqid_features in features_by_seqid.items():
+            seqid_features.sort()
+            self.starts[seqid] = np.array([start for start, end, feature_id in seqid_features], dtype=np.int64)
+            self.ends[seqid] = np.array([end for start, end, feature_id in seqid_features], dtype=np.int64)
+            self.max_ends[seqid] = np.maximum.accumulate(self.ends[seqid])
+            self.ids[seqid] = np.array([feature_id for start, end, feature_id in seqid_features])
+
+    @staticmethod
+    def from_gff(gff_file_path, feature_types=('gene',)):
+        return FeatureIndex(GffFeatures.in_(gff_file_path, set(feature_types)))
+
+    def overlapping(self, seqid, query_starts, query_ends):
+        """Returns the (query indices, feature IDs) of all overlapping (query, feature) pairs for queries on the seqid.
+
+        Queries are 1-based inclusive intervals and are all looked up at once.
+        """
+        if seqid not in self.starts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=str)
+        starts = self.starts[seqid]
+        ends = self.ends[seqid]
+
+        firsts = np.searchsorted(self.max_ends[seqid], query_starts, side='left')
+        lasts = np.searchsorted(starts, query_ends, side='right')
+        counts = np.maximum(lasts - firsts, 0)
+        num_candidates = int(counts.sum())
+        query_indices = np.repeat(np.arange(len(query_starts)), counts)
+        offsets = np.arange(num_candidates) - np.repeat(np.cumsum(counts) - counts, counts)
+        feature_indices = np.repeat(firsts, counts) + offsets
+
+        is_overlapping = ends[feature_indices] >= query_starts[query_indices]
+        return query_indices[is_overlapping], self.ids[seqid][feature_indices[is_overlapping]]
+
+
+class HostHsps:
+    @staticmethod
+    def in_(records, host_database):
+        """Returns a dictionary of arrays with a row for each hsp of the best host hit of each record.
+
+        Rows have the read ID, the contig (the first word of the hit title),
+        the query from and to, and the hit start and end (as hit start <= hit end, on either strand).
+        """
+        rows = [
+            (record['read_id'], record['hits'][host_database][0]['title'].split()[0], query_from, query_to, min(hit_from, hit_to), max(hit_from, hit_to))
+            for record in records
+            if host_database in record['hits']
+            for query_from, query_to, hit_from, hit_to, hit_strand in record['hits'][host_database][0]['hsps']
+        ]
+        return {
+            'read_ids': np.array([row[0] for row in rows]),
+            'contigs': np.array([row[1] for row in rows]),
+            'query_froms': np.array([row[2] for row in rows], dtype=np.int64),
+            'query_tos': np.array([row[3] for row in rows], dtype=np.int64),
+            'hit_starts': np.array([row[4] for row in rows], dtype=np.int64),
+            'hit_ends': np.array([row[5] for row in rows], dtype=np.int64),
+        }
+
+
+class HspGeneIDs:
+    @staticmethod
+    def for_(hsps, feature_index):
+        """Returns a list of the IDs of the genes overlapping each hsp (queried in one batch per contig)."""
+        gene_ids = [[] for _ in range(len(hsps['contigs']))]
+        for contig in np.unique(hsps['contigs']):
+            hsp_indices = np.flatnonzero(hsps['contigs'] == contig)
+            query_indices, feature_ids = feature_index.overlapping(
+                contig,
+                hsps['hit_starts'][hsp_indices],
+                hsps['hit_ends'][hsp_indices],
+            )
+            for query_index, feature_id in zip(hsp_indices[query_indices], feature_ids):
+                gene_ids[query_index].append(str(feature_id))
+        return gene_ids
+
+
+class TranscriptGeneIDs:
+    @staticmethod
+    def in_(gff_file_path, transcript_types=('mRNA', 'transcript')):
+        """Returns a dictionary of the gene ID (Parent) of each transcript in the GFF3 file (keyed by transcript ID)."""
+        return {
+            feature_id: attributes['Parent']
+            for seqid, start, end, feature_id, attributes in GffFeatures.in_(gff_file_path, set(transcript_types))
+            if 'Parent' in attributes
+        }
+
+
+def write_annotated_hsps(hsps, gene_ids, annotated_hsps_file_path):
+    """Writes the hsps with their gene IDs to a tab-separated file ("." for hsps without a gene)."""
+    with open(annotated_hsps_file_path, 'w', buffering=1 << 20) as f:
+        f.write('read_id\tcontig\tquery_from\tquery_to\thit_start\thit_end\tgene_ids\n')
+        for i, read_id in enumerate(hsps['read_ids']):
+            f.write(
+                f'{read_id}\t{hsps["contigs"][i]}\t{hsps["query_froms"][i]}\t{hsps["query_tos"][i]}'
+                f'\t{hsps["hit_starts"][i]}\t{hsps["hit_ends"][i]}\t{",".join(gene_ids[i]) or "."}\n'
+            )
+
+
+if __name__ == '__main__':
+    print()
+
+
+    joined_file_path = 'joined_hits_cy1_nb_6wpi_leaf.jsonl'
+    print(f'{joined_file_path=}')
+    print()
+
+    gff_file_path = 'nb_genome.gff3'
+    print(f'{gff_file_path=}')
+    print()
+
+
+    feature_index = FeatureIndex.from_gff(gff_file_path)
+    print(f'{sum(len(starts) for starts in feature_index.starts.values())=}')
+    print()
+
+
+    # NB-genome hits are annotated by overlap with genes
+    genome_hsps = HostHsps.in_(JoinedRecords.in_(joined_file_path), 'nb_genome')
+    genome_hsp_gene_ids = HspGeneIDs.for_(genome_hsps, feature_index)
+    print(f'{len(genome_hsps["read_ids"])=}')
+    print(f'{sum(len(gene_ids) > 0 for gene_ids in genome_hsp_gene_ids)=}')
+    print()
+
+    annotated_genome_hsps_file_path = 'annotated_nb_genome_hsps_' + joined_file_path.removeprefix('joined_hits_').removesuffix('.jsonl') + '.tsv'
+    print(f'{annotated_genome_hsps_file_path=}')
+    print()
+
+    write_annotated_hsps(genome_hsps, genome_hsp_gene_ids, annotated_genome_hsps_file_path)
+
+
+    # NB-transcript hits are annotated with the gene of the transcript
+    transcript_gene_ids = TranscriptGeneIDs.in_(gff_file_path)
+    transcript_hsps = HostHsps.in_(JoinedRecords.in_(joined_file_path), 'nb_transcripts')
+    transcript_hsp_gene_ids = [
+        [transcript_gene_ids[contig]] if contig in transcript_gene_ids else []
+        for contig in transcript_hsps['contigs']
+    ]
+    print(f'{len(transcript_hsps["read_ids"])=}')
+    print(f'{sum(len(gene_ids) > 0 for gene_ids in transcript_hsp_gene_ids)=}')
+    print()
+
+    annotated_transcript_hsps_file_path = 'annotated_nb_transcripts_hsps_' + joined_file_path.removeprefix('joined_hits_').removesuffix('.jsonl') + '.tsv'
+    print(f'{annotated_transcript_hsps_file_path=}')
+    print()
+
+    write_annotated_hsps(transcript_hsps, transcript_hsp_gene_ids, annotated_transcript_hsps_file_path)
@@ -247,6 +247,39 @@ class NumUniqueAlignedReadPositions:
         return len(UniqueAlignedReadPositions.for_(hit))
 
 
+class SearchesByReadID:
+    @staticmethod
+    def in_(searches):
+        """Returns a dictionary of the searches keyed by read ID."""
+        searches_by_read_id = {ReadID.for_(search): search for search in searches}
+        # each read should only be searched once
+        assert len(searches_by_read_id) == len(searches)
+        return searches_by_read_id
+
+
+class ChimericSearches:
+    @staticmethod
+    def in_(viral_searches, *host_searches_lists):
+        """Returns a (viral search, host search, ...) tuple for each read with a search in every list.
+
+        Tuples are in the order of the first list of host searches.
+        Each list is indexed by read ID once, so this is linear in the total number of searches.
+        """
+        assert len(host_searches_lists) > 0
+        viral_searches_by_read_id = SearchesByReadID.in_(viral_searches)
+        other_host_searches_by_read_id = [SearchesByReadID.in_(host_searches) for host_searches in host_searches_lists[1:]]
+        return [
+            (
+                viral_searches_by_read_id[ReadID.for_(host_search)],
+                host_search,
+                *[host_searches_by_read_id[ReadID.for_(host_search)] for host_searches_by_read_id in other_host_searches_by_read_id],
+            )
+            for host_search in host_searches_lists[0]
+            if ReadID.for_(host_search) in viral_searches_by_read_id
+            and all(ReadID.for_(host_search) in host_searches_by_read_id for host_searches_by_read_id in other_host_searches_by_read_id)
+        ]
+
+
 print()
 
 
@@ -290,18 +323,13 @@ print(f'{len(searches_with_a_cy1_hit)=}')
 print()
 
 
-cy1_read_ids = set([ReadID.for_(search) for search in searches_with_a_cy1_hit])
-print(f'{len(cy1_read_ids)=}')
-print()
-
-
 searches_with_an_nb_transcripts_hit = list(filter(has_a_hit, Searches.in_(blast_to_nb_transcripts_output)))
 print(f'{len(searches_with_an_nb_transcripts_hit)=}')
 print()
 
 
-nb_transcript_read_ids = list(map(lambda search : ReadID.for_(search), searches_with_an_nb_transcripts_hit))
-cy1_nb_transcript_chimeric_read_ids = list(filter(lambda read_id : read_id in cy1_read_ids, nb_transcript_read_ids))
+cy1_nb_transcript_chimeric_searches = ChimericSearches.in_(searches_with_a_cy1_hit, searches_with_an_nb_transcripts_hit)
+cy1_nb_transcript_chimeric_read_ids = [ReadID.for_(cy1_search) for cy1_search, nb_transcripts_search in cy1_nb_transcript_chimeric_searches]
 print(f'{len(cy1_nb_transcript_chimeric_read_ids)=}')
 print()
 
@@ -311,8 +339,8 @@ print(f'{len(searches_with_an_nb_genome_hit)=}')
 print()
 
 
-nb_genome_read_ids = list(map(lambda search : ReadID.for_(search), searches_with_an_nb_genome_hit))
-cy1_nb_genome_chimeric_read_ids = list(filter(lambda read_id : read_id in cy1_read_ids, nb_genome_read_ids))
+cy1_nb_genome_chimeric_searches = ChimericSearches.in_(searches_with_a_cy1_hit, searches_with_an_nb_genome_hit)
+cy1_nb_genome_chimeric_read_ids = [ReadID.for_(cy1_search) for cy1_search, nb_genome_search in cy1_nb_genome_chimeric_searches]
 print(f'{len(cy1_nb_genome_chimeric_read_ids)=}')
 print()
 
@@ -322,18 +350,12 @@ print(f'{len(unique_chimeric_read_ids)=}')
 print()
 
 
-searches_to_cy1_for_cy1_nb_transcript_chimeric_reads = list(map(
-    lambda read_id : next(search for search in searches_with_a_cy1_hit if ReadID.for_(search) == read_id),
-    cy1_nb_transcript_chimeric_read_ids,
-))
+searches_to_cy1_for_cy1_nb_transcript_chimeric_reads = [cy1_search for cy1_search, nb_transcripts_search in cy1_nb_transcript_chimeric_searches]
 print(f'{len(searches_to_cy1_for_cy1_nb_transcript_chimeric_reads)=}')
 print()
 
 
-searches_to_cy1_for_cy1_nb_genome_chimeric_reads = list(map(
-    lambda read_id : next(search for search in searches_with_a_cy1_hit if ReadID.for_(search) == read_id),
-    cy1_nb_genome_chimeric_read_ids,
-))
+searches_to_cy1_for_cy1_nb_genome_chimeric_reads = [cy1_search for cy1_search, nb_genome_search in cy1_nb_genome_chimeric_searches]
 print(f'{len(searches_to_cy1_for_cy1_nb_genome_chimeric_reads)=}')
 print()
 
@@ -3,6 +3,63 @@ import json
 import matplotlib.pyplot as plt
 
 
+class FastqChunks:
+    @staticmethod
+    def in_(file_path, chunk_size=1 << 24):
+        """Yields lists of the (read ID, read sequence, quality) records in the FASTQ file.
+
+        Records are read in chunks of about chunk-size bytes and are given as bytes.
+        All read sequences in a chunk are checked to only contain A, U, G and C at once.
+        """
+        with open(file_path, 'rb') as f:
+            leftover = b''
+            while True:
+                chunk = f.read(chunk_size)
+                data = leftover + chunk
+                lines = data.split(b'\n')
+                if chunk:
+                    # the last line might be incomplete
+                    num_complete_lines = len(lines) - 1
+                else:
+                    # no trailing newline at the end of the file
+                    if lines[-1] == b'':
+                        lines.pop()
+                    num_complete_lines = len(lines)
+                    assert num_complete_lines % 4 == 0
+                num_record_lines = num_complete_lines - (num_complete_lines % 4)
+                leftover = b'\n'.join(lines[num_record_lines:])
+
+                records = []
+                for i in range(0, num_record_lines, 4):
+                    assert lines[i][:1] == b'@'
+                    read_id = lines[i][1:37]
+                    assert len(read_id) == 36
+                    read_seq = lines[i + 1]
+                    assert len(read_seq) > 0
+                    assert lines[i + 2][:1] == b'+'
+                    quality = lines[i + 3]
+                    assert len(quality) == len(read_seq)
+                    records.append((read_id, read_seq, quality))
+
+                # all remaining characters are something other than A, U, G or C
+                assert len(b''.join([read_seq for read_id, read_seq, quality in records]).translate(None, b'AUGC')) == 0
+
+                if records:
+                    yield records
+
+                if not chunk:
+                    assert leftover == b''
+                    break
+
+
+class FastqRecords:
+    @staticmethod
+    def in_(file_path):
+        """Yields the (read ID, read sequence, quality) records in the FASTQ file one at a time."""
+        for records in FastqChunks.in_(file_path):
+            yield from records
+
+
 print()
 
 
@@ -12,28 +69,16 @@ print('Reads file path: ' + reads_file_path)
 print()
 
 
-reads = {}
-
-with open(reads_file_path, 'r') as f:
-    lines = f.read().splitlines()
-    for i in range(0, len(lines), 4):
-        assert lines[i][0] == '@'
-        read_id = lines[i][1:37]
-        assert len(read_id) == 36
-        read_seq = lines[i + 1]
-        assert len(read_seq) > 0
-        for c in read_seq:
-            assert c in 'AUGC'
-        reads[read_id] = read_seq
+read_lengths = [len(read_seq) for read_id, read_seq, quality in FastqRecords.in_(reads_file_path)]
 
-print('Reads found: ' + str(len(reads)))
+print('Reads found: ' + str(len(read_lengths)))
 print()
 
 
 fig, ax = plt.subplots()
 
 plt.hist(
-    [len(read_seq) for read_id, read_seq in reads.items()],
+    read_lengths,
     bins=200,
     color='black',
 )